@@ -0,0 +1,62 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "medical_student_analysis")
+
+
+def make_key(*parts):
+    """Builds a content-addressable SHA-256 key from the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (str, bytes)):
+            part = json.dumps(part, sort_keys=True, separators=(',', ':'), default=str)
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """A tiny on-disk key/value store holding one JSON file per entry."""
+
+    def __init__(self, namespace, cache_dir=None):
+        base_dir = cache_dir or os.getenv('AGENT_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.cache_dir = os.path.join(base_dir, namespace)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key, max_age=None):
+        """Returns the cached value for key, or None on a miss or expired entry."""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if max_age is not None and time.time() - entry.get('ts', 0) > max_age:
+            return None
+        return entry.get('value')
+
+    def put(self, key, value):
+        """Stores value under key. Write failures are reported but never raised."""
+        path = self._path(key)
+        entry = {
+            'value': value,
+            'ts': time.time(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.error("DiskCache: Failed to write cache entry %s: %s", key, e)
@@ -0,0 +1,21 @@
+from functools import lru_cache
+
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+
+DRIVE_SCOPES = ('https://www.googleapis.com/auth/drive.readonly',)
+
+
+@lru_cache(maxsize=None)
+def get_drive_service(service_account_file):
+    """
+    Returns a process-wide Drive v3 client for service_account_file, parsing the key file
+    and building the client on first use so every agent shares the same credentials.
+    """
+    credentials = service_account.Credentials.from_service_account_file(
+        service_account_file,
+        scopes=list(DRIVE_SCOPES)
+    )
+    # Use the discovery document bundled with google-api-python-client instead of fetching
+    # it over the network on every cold start; there is nothing to cache on disk either.
+    return build('drive', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
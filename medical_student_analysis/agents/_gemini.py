@@ -0,0 +1,20 @@
+import json
+
+import google.generativeai as genai
+
+_MODEL_CACHE = {}
+
+
+def get_model(model_name, **generation_config):
+    """
+    Returns a process-wide GenerativeModel for model_name and generation_config,
+    creating it on first use so every agent shares the same warm client.
+    """
+    key = (model_name, json.dumps(generation_config, sort_keys=True))
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = _MODEL_CACHE[key] = genai.GenerativeModel(
+            model_name,
+            generation_config=generation_config or None
+        )
+    return model
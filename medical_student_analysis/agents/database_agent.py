@@ -1,12 +1,68 @@
+import logging
 import pymysql
+import random
 import re
-import os
-import google.generativeai as genai
+import time
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from google.api_core import exceptions as google_exceptions
+
+from ._cache import DiskCache, make_key
+from ._gemini import get_model
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever _build_sql_prompt changes so cached SQL from older prompts is ignored.
+SQL_PROMPT_VERSION = "2"
+
+# Schema text is shared by every agent in the process for this long before it is re-read.
+SCHEMA_CACHE_TTL = 300  # seconds
+# Across runs the schema text is kept on disk, keyed by a cheap fingerprint of the tables.
+# The age cap covers in-place ALTERs that don't move the tables' CREATE_TIME.
+SCHEMA_DISK_CACHE_TTL = 86400  # seconds
+
+# Rows for recently executed SELECTs, so the same SQL doesn't hit MySQL again right away.
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = 60  # seconds
+
+# Compiled once at import instead of on every LLM response. The body is bounded so a
+# response without a terminating semicolon can't make the lazy match scan unboundedly.
+# Generation stops at ";" (see SQL_GENERATION_CONFIG), which Gemini drops from the
+# output, so the statement may also run to the end of the response.
+_SQL_RE = re.compile(r"(SELECT\s[\s\S]{1,8192}?)(?:;|\Z)", re.IGNORECASE)
+_TOP_RE = re.compile(r"\bTOP\b", re.IGNORECASE)  # whole word, so LAPTOP or STOP_DATE pass
+
+# Greedy, single-candidate decoding that ends at the statement terminator: the same prompt
+# yields the same SQL, which is what makes caching it safe.
+SQL_GENERATION_CONFIG = {
+    "max_output_tokens": 200,
+    "temperature": 0.0,
+    "top_p": 1.0,
+    "candidate_count": 1,
+    "stop_sequences": [";"],
+}
+
+# Gemini errors that are worth another attempt. Anything else unexpected (auth failures,
+# programming errors) is surfaced immediately instead of burning the remaining retries.
+TRANSIENT_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
 
 class DatabaseAgent:
+    # (host, port, database) -> (fetched_at, schema), shared across instances.
+    _schema_cache = {}
+
     def __init__(self, db_config, gemini_model_name="gemini-1.5-flash"):
         self.db_config = db_config
-        self.model = genai.GenerativeModel(gemini_model_name)
+        self.model_name = gemini_model_name
+        self.model = get_model(gemini_model_name, **SQL_GENERATION_CONFIG)
+        self.sql_cache = DiskCache("sql")
+        self.schema_disk_cache = DiskCache("schema")
+        self.result_cache = OrderedDict()  # normalized SQL -> (fetched_at, rows)
         self.conn = None
         self.cursor = None
 
@@ -22,10 +78,10 @@ class DatabaseAgent:
                 cursorclass=pymysql.cursors.DictCursor
             )
             self.cursor = self.conn.cursor()
-            print("DatabaseAgent: MySQL database connection successful.")
+            logger.info("DatabaseAgent: MySQL database connection successful.")
             return True
         except pymysql.Error as ex:
-            print(f"DatabaseAgent: MySQL connection failed: {ex}")
+            logger.error("DatabaseAgent: MySQL connection failed: %s", ex)
             return False
 
     def disconnect(self):
@@ -33,63 +89,72 @@ class DatabaseAgent:
             self.cursor.close()
         if self.conn:
             self.conn.close()
-            print("DatabaseAgent: Database connection closed.")
+            logger.info("DatabaseAgent: Database connection closed.")
 
     def get_schema(self):
-        """Introspects the MySQL database to retrieve schema information."""
+        """
+        Returns the schema description for the configured database. It is introspected at
+        most once per SCHEMA_CACHE_TTL per process, so new agents don't repeat the round-trips,
+        and reused from disk across runs while the tables' fingerprint is unchanged.
+        """
         if not self.cursor:
-            print("DatabaseAgent: Not connected to database. Cannot get schema.")
+            logger.warning("DatabaseAgent: Not connected to database. Cannot get schema.")
             return None
-        
-        schema = ""
-        self.cursor.execute("SHOW TABLES")
-        
-        tables = []
-        fetched_tables = self.cursor.fetchall()
-        
-        if fetched_tables:
-            db_name = self.db_config.get('database', 'SchoolDb')
-            
-            # --- DEBUGGING: Print the first row to see its structure ---
-            print(f"DatabaseAgent: Debugging fetched_tables[0]: {fetched_tables[0]}")
-            # --- END DEBUGGING ---
-
-            if isinstance(fetched_tables[0], dict):
-                # Attempt to find the correct key for the table name
-                table_key = None
-                for key in fetched_tables[0]:
-                    if key.lower().startswith('tables_in_') or key.lower() == 'table':
-                        table_key = key
-                        break
-                
-                if table_key:
-                    tables = [row[table_key] for row in fetched_tables]
-                else:
-                    print("DatabaseAgent: Warning: Could not determine the table name key from dictionary. Available keys:", fetched_tables[0].keys())
-                    return None
-            else: # Assume it's a list of tuples
-                tables = [row[0] for row in fetched_tables]
-
-        if not tables:
-            print("DatabaseAgent: No tables found or failed to extract table names.")
+
+        cache_key = (self.db_config.get('host'), self.db_config.get('port'), self.db_config.get('database'))
+        cached = DatabaseAgent._schema_cache.get(cache_key)
+        if cached and time.time() - cached[0] < SCHEMA_CACHE_TTL:
+            logger.info("DatabaseAgent: ♻️ Using cached schema.")
+            return cached[1]
+
+        disk_key = make_key(*cache_key, self._schema_fingerprint())
+        schema = self.schema_disk_cache.get(disk_key, max_age=SCHEMA_DISK_CACHE_TTL)
+        if schema:
+            logger.info("DatabaseAgent: ♻️ Using schema cached on disk.")
+        else:
+            schema = self._introspect_schema()
+            if schema:
+                self.schema_disk_cache.put(disk_key, schema)
+        if schema:
+            DatabaseAgent._schema_cache[cache_key] = (time.time(), schema)
+        return schema
+
+    def _schema_fingerprint(self):
+        """Returns a cheap, single-row summary of the tables that changes when they are (re)created."""
+        self.cursor.execute(
+            """
+            SELECT COUNT(*) AS table_count, MAX(CREATE_TIME) AS last_created
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = %s
+            """,
+            (self.db_config.get('database', 'SchoolDb'),)
+        )
+        return self.cursor.fetchone()
+
+    def _introspect_schema(self):
+        """Introspects the MySQL database to retrieve schema information in a single query."""
+        # One round-trip for every table's columns instead of SHOW TABLES + SHOW COLUMNS per table.
+        self.cursor.execute(
+            """
+            SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+            """,
+            (self.db_config.get('database', 'SchoolDb'),)
+        )
+        columns = self.cursor.fetchall()
+
+        if not columns:
+            logger.error("DatabaseAgent: No tables found or failed to extract table names.")
             return None
 
-        for table in tables:
-            self.cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-            columns = self.cursor.fetchall()
-            schema += f"Table: {table}\n"
-            
-            for column in columns:
-                if isinstance(column, dict):
-                    column_name = column["Field"]
-                    data_type = column["Type"]
-                else:
-                    column_name = column[0]
-                    data_type = column[1]
-                    
-                schema += f"- {column_name} ({data_type})\n"
-            schema += "\n"
-        return schema.strip()
+        parts = []
+        for table, table_columns in groupby(columns, key=itemgetter('table_name')):
+            parts.append(f"Table: {table}\n")
+            parts.extend(f"- {column['column_name']} ({column['column_type']})\n" for column in table_columns)
+            parts.append("\n")
+        return "".join(parts).strip()
 
     def _build_sql_prompt(self, user_question, schema, error_message=None, previous_sql=None):
         """Constructs the prompt messages for the LLM to generate SQL."""
@@ -111,14 +176,18 @@ IMPORTANT SEMANTIC INSTRUCTIONS:
 - Always aim to provide complete data that allows identification of individuals mentioned in the question.
 """
 
-        user_message_content = f"""
+        # Stable prefix first: it is identical across questions and retries for the same
+        # schema, so Gemini's implicit prefix caching can reuse it. Only the short tail varies.
+        stable_prefix = f"""{system_instruction}
+
 Schema:
 {schema}
-
+"""
+        volatile_tail = f"""
 Question: "{user_question}"
 """
         if error_message:
-            user_message_content = f"""
+            volatile_tail += f"""
 You previously generated this SQL which failed:
 
 {previous_sql}
@@ -126,68 +195,101 @@ You previously generated this SQL which failed:
 The error was:
 {error_message}
 
-Try again. ONLY use the tables and columns listed in this schema.
-
-{user_message_content}
+Try again. ONLY use the tables and columns listed in the schema above.
 """
-        user_message_content += "\nOutput:"
+        volatile_tail += "\nOutput:"
         
         contents = [
-            {"role": "user", "parts": [{"text": system_instruction + "\n\n" + user_message_content}]}
+            {"role": "user", "parts": [{"text": stable_prefix}, {"text": volatile_tail}]}
         ]
         return contents
 
     def _extract_valid_sql(self, text):
         """Extracts a valid SQL SELECT statement from the LLM's response."""
-        match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
+        # A plain substring scan rejects refusals and chatter without running the regex.
+        match = _SQL_RE.search(text) if "select" in text.lower() else None
         if not match:
             raise ValueError("No valid SELECT statement found in LLM response.")
-        sql = match.group(1).strip()
+        # Drop a dangling code fence left by a terminator-less response, then restore the ";".
+        sql = match.group(1).strip().rstrip("`").strip() + ";"
         
-        if "TOP" in sql.upper():
+        if _TOP_RE.search(sql):
             raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
         
         return sql
 
+    def _execute_select(self, sql):
+        """Executes a SELECT and returns its rows, reusing recent results for the same SQL."""
+        key = " ".join(sql.split()).rstrip(";")
+        cached = self.result_cache.get(key)
+        if cached and time.time() - cached[0] < RESULT_CACHE_TTL:
+            self.result_cache.move_to_end(key)
+            logger.info("DatabaseAgent: ♻️ Using cached query results.")
+            return cached[1]
+
+        self.cursor.execute(sql)
+        data = self.cursor.fetchall()
+        self.result_cache[key] = (time.time(), data)
+        self.result_cache.move_to_end(key)
+        if len(self.result_cache) > RESULT_CACHE_SIZE:
+            self.result_cache.popitem(last=False)
+        return data
+
     def query_database(self, user_question, schema, max_retries=2):
         """Generates SQL and executes it, with retry logic."""
+        cache_key = make_key(self.model_name, SQL_PROMPT_VERSION, schema, user_question)
+        cached_sql = self.sql_cache.get(cache_key)
+        if cached_sql:
+            logger.debug("DatabaseAgent: ♻️ Using cached SQL:\n%s", cached_sql)
+            try:
+                data = self._execute_select(cached_sql)
+                logger.info("DatabaseAgent: SQL query executed successfully.")
+                return data
+            except pymysql.Error as pe:
+                logger.warning("DatabaseAgent: 🚨 Cached SQL failed, regenerating: %s", pe)
+
         attempt = 0
         error_message = None
         sql_query = None
 
         while attempt < max_retries:
-            print(f"DatabaseAgent: Attempt {attempt + 1} to generate and execute SQL for: '{user_question}'")
+            logger.info("DatabaseAgent: Attempt %s to generate and execute SQL for: '%s'", attempt + 1, user_question)
             prompt_contents = self._build_sql_prompt(user_question, schema, error_message, sql_query)
             
             try:
-                response = self.model.generate_content(
-                    prompt_contents,
-                    generation_config={"max_output_tokens": 200}
-                )
+                response = self.model.generate_content(prompt_contents)
                 
                 raw_response = response.text.strip()
-                print(f"DatabaseAgent: 🔍 LLM Raw Response:\n{raw_response}")
+                logger.debug("DatabaseAgent: 🔍 LLM Raw Response:\n%s", raw_response)
 
                 sql_query = self._extract_valid_sql(raw_response)
-                print(f"DatabaseAgent: ✅ Extracted SQL:\n{sql_query}")
+                logger.debug("DatabaseAgent: ✅ Extracted SQL:\n%s", sql_query)
 
-                self.cursor.execute(sql_query)
-                data = self.cursor.fetchall()
-                print("DatabaseAgent: SQL query executed successfully.")
+                data = self._execute_select(sql_query)
+                logger.info("DatabaseAgent: SQL query executed successfully.")
+                self.sql_cache.put(cache_key, sql_query)
                 return data
 
             except ValueError as ve:
                 error_message = str(ve)
-                print(f"DatabaseAgent: 🚨 Validation Error: {error_message}")
+                logger.warning("DatabaseAgent: 🚨 Validation Error: %s", error_message)
                 attempt += 1
             except pymysql.Error as pe:
                 error_message = f"MySQL Error: {pe}"
-                print(f"DatabaseAgent: 🚨 MySQL Error: {error_message}")
+                logger.warning("DatabaseAgent: 🚨 MySQL Error: %s", error_message)
+                attempt += 1
+            except TRANSIENT_GEMINI_ERRORS as ge:
+                # Not the SQL's fault, so keep the previous error_message for the next prompt.
+                logger.warning("DatabaseAgent: 🚨 Transient Gemini Error: %s", ge)
                 attempt += 1
+                if attempt < max_retries:
+                    delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                    logger.warning("DatabaseAgent: Retrying in %.1fs", delay)
+                    time.sleep(delay)
             except Exception as e:
                 error_message = str(e)
-                print(f"DatabaseAgent: 🚨 Unexpected Error during SQL generation/execution: {error_message}")
+                logger.error("DatabaseAgent: 🚨 Unexpected Error during SQL generation/execution: %s", error_message)
                 attempt += 1
         
-        print("DatabaseAgent: ❌ Failed to generate and execute a successful SQL query after retries.")
+        logger.error("DatabaseAgent: ❌ Failed to generate and execute a successful SQL query.")
         return None
\ No newline at end of file
@@ -1,14 +1,50 @@
 import os
 import io
+import logging
 import PyPDF2
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from functools import lru_cache
 from googleapiclient.http import MediaIoBaseDownload
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Optional speed-up; PyPDF2 is used otherwise.
+    pdfium = None
+
+from ._cache import DiskCache, make_key
+from ._drive import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+# Only this much document text is passed downstream, so extraction stops once it is reached.
+MAX_DOCUMENT_CHARS = 2000
+
+# Pinned to googleapiclient's own default (100 MB): any medical record arrives in a single
+# ranged GET, so there are no per-chunk round-trips to parallelize or tune away.
+DOWNLOAD_CHUNK_SIZE = 100 * 1024 * 1024
+
+GOOGLE_DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+
+# md5Checksum (binary files) and modifiedTime (Google Docs) identify a file's content
+# version, so extracted text can be reused until the file changes.
+SEARCH_FIELDS = "files(id, name, mimeType, md5Checksum, modifiedTime)"
+
+@lru_cache(maxsize=None)
+def _mime_clause(mime_type):
+    """Returns the ' and mimeType=...' query clause for one MIME type or a tuple of them."""
+    if isinstance(mime_type, tuple):
+        return " and (" + " or ".join(f"mimeType='{m}'" for m in mime_type) + ")"
+    return f" and mimeType='{mime_type}'" if mime_type else ""
+
 class DocumentAgent:
-    def __init__(self, service_account_file):
+    def __init__(self, service_account_file, default_folder_id=None, debug_list_on_miss=False):
         self.service_account_file = service_account_file
         self.drive_service = None
+        self.text_cache = DiskCache("documents")
+        # When set (and debug logging is on), a search miss also lists the root folder.
+        self.debug_list_on_miss = debug_list_on_miss
+        # Used when a search doesn't name a folder; its query clause is built once here.
+        self.default_folder_id = default_folder_id
+        self._default_folder_clause = f" and '{default_folder_id}' in parents" if default_folder_id else ""
 
     def initialize_drive(self):
         """Initialize the Google Drive API service using service account credentials."""
@@ -16,52 +52,46 @@ class DocumentAgent:
             if not self.service_account_file or not os.path.exists(self.service_account_file):
                 raise ValueError(f"GOOGLE_SERVICE_ACCOUNT_FILE not found or invalid path: {self.service_account_file}")
             
-            credentials = service_account.Credentials.from_service_account_file(
-                self.service_account_file,
-                scopes=['https://www.googleapis.com/auth/drive.readonly']
-            )
-            self.drive_service = build('drive', 'v3', credentials=credentials)
-            print("DocumentAgent: Google Drive service initialized successfully.")
+            self.drive_service = get_drive_service(self.service_account_file)
+            logger.info("DocumentAgent: Google Drive service initialized successfully.")
             return True
         except Exception as e:
-            print(f"DocumentAgent: Failed to initialize Google Drive service: {e}")
+            logger.error("DocumentAgent: Failed to initialize Google Drive service: %s", e)
             self.drive_service = None
             return False
 
+    def _build_query(self, query, mime_type=None, folder_id=None):
+        """Combines the base query with optional MIME type and parent folder filters."""
+        if isinstance(mime_type, list):
+            mime_type = tuple(mime_type)  # hashable for the clause cache
+        if folder_id is None or folder_id == self.default_folder_id:
+            folder_clause = self._default_folder_clause
+        else:
+            folder_clause = f" and '{folder_id}' in parents"
+        return f"{query}{_mime_clause(mime_type)}{folder_clause}"
+
     def search_files(self, query, mime_type=None, folder_id=None): # <--- folder_id parameter added here
         """Search for files in Google Drive matching the query, optionally within a specific folder."""
         if not self.drive_service:
-            print("DocumentAgent: Drive service not initialized.")
+            logger.warning("DocumentAgent: Drive service not initialized.")
             return []
         try:
-            # Start with the base query
-            q_parts = [query]
-
-            if mime_type:
-                q_parts.append(f"mimeType='{mime_type}'")
-            
-            if folder_id: # <--- Logic to include folder_id in query
-                q_parts.append(f"'{folder_id}' in parents")
-            
-            # Combine all parts with 'and'
-            full_query = " and ".join(q_parts)
-
             params = {
-                'q': full_query, # <--- Use full_query
+                'q': self._build_query(query, mime_type, folder_id),
                 'pageSize': 10,
-                'fields': "files(id, name, mimeType)"
+                'fields': SEARCH_FIELDS
             }
             
             results = self.drive_service.files().list(**params).execute()
             return results.get('files', [])
         except Exception as e:
-            print(f"DocumentAgent: Error searching files: {e}")
+            logger.error("DocumentAgent: Error searching files: %s", e)
             return []
 
     def list_root_files(self):
         """List files in the root directory of Google Drive."""
         if not self.drive_service:
-            print("DocumentAgent: Drive service not initialized.")
+            logger.warning("DocumentAgent: Drive service not initialized.")
             return []
         try:
             results = self.drive_service.files().list(
@@ -71,18 +101,21 @@ class DocumentAgent:
             ).execute()
             return results.get('files', [])
         except Exception as e:
-            print(f"DocumentAgent: Error listing root directory files: {e}")
+            logger.error("DocumentAgent: Error listing root directory files: %s", e)
             return []
 
-    def download_pdf(self, file_id):
-        """Download a PDF file from Google Drive and extract its text content."""
+    def download_pdf(self, file_id, max_chars=None):
+        """
+        Download a PDF file from Google Drive and extract its text content.
+        With max_chars, pages past the point where that much text is collected are skipped.
+        """
         if not self.drive_service:
-            print("DocumentAgent: Drive service not initialized.")
+            logger.warning("DocumentAgent: Drive service not initialized.")
             return None
         try:
             request = self.drive_service.files().get_media(fileId=file_id)
             file = io.BytesIO()
-            downloader = MediaIoBaseDownload(file, request)
+            downloader = MediaIoBaseDownload(file, request, chunksize=DOWNLOAD_CHUNK_SIZE)
             
             done = False
             while not done:
@@ -90,47 +123,103 @@ class DocumentAgent:
             
             file.seek(0)
             
-            # Read PDF content
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                extracted_page_text = page.extract_text()
-                if extracted_page_text:
-                    text += extracted_page_text + "\n"
+            text = self._extract_pdf_text(file, max_chars)
             
             return text
         except Exception as e:
-            print(f"DocumentAgent: Error downloading/reading PDF (File ID: {file_id}): {e}")
+            logger.error("DocumentAgent: Error downloading/reading PDF (File ID: %s): %s", file_id, e)
             return None
 
+    def export_text(self, file_id):
+        """Export a Google Docs file as plain text on Drive's side, without local parsing."""
+        if not self.drive_service:
+            logger.warning("DocumentAgent: Drive service not initialized.")
+            return None
+        try:
+            data = self.drive_service.files().export_media(fileId=file_id, mimeType='text/plain').execute()
+            return data.decode('utf-8-sig')
+        except Exception as e:
+            logger.error("DocumentAgent: Error exporting document (File ID: %s): %s", file_id, e)
+            return None
+
+    def _extract_pdf_text(self, file, max_chars=None):
+        """
+        Extracts page text in order, preferring the much faster PDFium backend.
+        Stops at the first page that brings the text to max_chars, if given.
+        """
+        chunks = []
+        total = 0
+        if pdfium is not None:
+            # Hand PDFium the buffer itself: it reads through it on demand, so only the
+            # pages that are touched are parsed and no second copy of the bytes is made.
+            pdf = pdfium.PdfDocument(file)
+            try:
+                for page in pdf:
+                    chunks.append(page.get_textpage().get_text_range() + "\n")
+                    total += len(chunks[-1])
+                    if max_chars is not None and total >= max_chars:
+                        break
+            finally:
+                pdf.close()
+            return "".join(chunks)
+
+        # Read PDF content
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages:
+            extracted_page_text = page.extract_text()
+            if extracted_page_text:
+                chunks.append(extracted_page_text + "\n")
+                total += len(chunks[-1])
+                if max_chars is not None and total >= max_chars:
+                    break
+        return "".join(chunks)
+
     def find_and_extract_text(self, file_query, mime_type='application/pdf', folder_id=None): # <--- folder_id parameter added here
-        """Searches for files and extracts text content from the first matching PDF."""
-        print(f"DocumentAgent: Searching for files with query: '{file_query}', MIME type: '{mime_type}', and Folder ID: '{folder_id}'")
+        """
+        Searches for files and extracts text content from the first match. mime_type may be
+        a list; Google Docs matches are exported as text by Drive instead of parsed locally.
+        """
+        folder_id = folder_id or self.default_folder_id
+        logger.info("DocumentAgent: Searching for files with query: '%s', MIME type: '%s', and Folder ID: '%s'", file_query, mime_type, folder_id)
         # Pass folder_id to search_files
         files = self.search_files(file_query, mime_type=mime_type, folder_id=folder_id) 
         
         if not files:
-            print(f"DocumentAgent: No files found matching your query: '{file_query}' in folder '{folder_id}'.")
-            print("DocumentAgent: Listing files in the root directory for debugging (this might not be the target folder):")
-            root_files = self.list_root_files()
-            if root_files:
-                for i, file in enumerate(root_files, 1):
-                    print(f"   {i}. {file['name']} (Type: {file['mimeType']}, ID: {file['id']})")
-            else:
-                print("   No files found in the root directory or error occurred while listing.")
+            logger.warning("DocumentAgent: No files found matching your query: '%s' in folder '%s'.", file_query, folder_id)
+            if self.debug_list_on_miss and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("DocumentAgent: Listing files in the root directory for debugging (this might not be the target folder):")
+                root_files = self.list_root_files()
+                if root_files:
+                    for i, file in enumerate(root_files, 1):
+                        logger.debug("   %s. %s (Type: %s, ID: %s)", i, file['name'], file['mimeType'], file['id'])
+                else:
+                    logger.debug("   No files found in the root directory or error occurred while listing.")
             return None
         
-        print(f"DocumentAgent: Found {len(files)} file(s) matching '{file_query}' in folder '{folder_id}':")
+        logger.info("DocumentAgent: Found %s file(s) matching '%s' in folder '%s':", len(files), file_query, folder_id)
         for i, file in enumerate(files, 1):
-            print(f"{i}. {file['name']} (ID: {file['id']})")
+            logger.debug("%s. %s (ID: %s)", i, file['name'], file['id'])
         
         # For simplicity, process the first file found. Could be expanded to process multiple.
         selected_file = files[0]
-        print(f"\nDocumentAgent: Processing file: {selected_file['name']} (ID: {selected_file['id']})")
+        logger.info("DocumentAgent: Processing file: %s (ID: %s)", selected_file['name'], selected_file['id'])
         
-        file_content = self.download_pdf(selected_file['id'])
+        version = selected_file.get('md5Checksum') or selected_file.get('modifiedTime')
+        cache_key = make_key(selected_file['id'], version, MAX_DOCUMENT_CHARS) if version else None
+        file_content = self.text_cache.get(cache_key) if cache_key else None
+        if file_content:
+            logger.info("DocumentAgent: ♻️ Using cached text for %s.", selected_file['name'])
+            return file_content
+
+        if selected_file.get('mimeType') == GOOGLE_DOC_MIME_TYPE:
+            file_content = self.export_text(selected_file['id'])
+        else:
+            file_content = self.download_pdf(selected_file['id'], max_chars=MAX_DOCUMENT_CHARS)
         if not file_content:
-            print("DocumentAgent: Failed to extract content from PDF.")
+            logger.error("DocumentAgent: Failed to extract content from document.")
             return None
         
-        return file_content[:2000] # Limit content to avoid excessive token usage downstream
\ No newline at end of file
+        file_content = file_content[:MAX_DOCUMENT_CHARS] # Limit content to avoid excessive token usage downstream
+        if cache_key:
+            self.text_cache.put(cache_key, file_content)
+        return file_content
\ No newline at end of file
@@ -1,65 +1,128 @@
 # synthesis_agent.py
 
-import google.generativeai as genai
 import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder is used otherwise.
+    orjson = None
+
+from ._cache import DiskCache, make_key
+from ._gemini import get_model
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the synthesis prompt changes so answers cached for older prompts are ignored.
+SYNTHESIS_PROMPT_VERSION = "2"
+SYNTHESIS_CACHE_TTL = 3600  # seconds
+# The answer is about one student; more rows than this only add prefill tokens.
+MAX_PROMPT_ROWS = 50
+
+# Fixed instructions go first so every request shares the same prompt prefix,
+# which is what Gemini's implicit prefix caching keys on.
+SYNTHESIS_INSTRUCTIONS = (
+    "Based on the 'Original User Question', use the 'Database Query Results' to identify the student by name. "
+    "Then, use this identified student's name to find their corresponding medical history in the 'Relevant Document Content'. "
+    "Finally, extract the *latest* or most relevant medical record for that specific student. "
+    "Provide a concise and clear answer to the original user question. "
+    "If the student cannot be identified or their medical record is not found in the documents, clearly state that. "
+    "Prioritize direct answers if available. "
+    "Output only the answer, no extra text or comments.\n\n"
+)
+
+def _dumps_compact(data):
+    """Encodes data as compact JSON, stringifying values like Decimal and dates from MySQL."""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=str)
 
 class SynthesisAgent:
     def __init__(self, gemini_model_name="gemini-1.5-flash"):
-        self.model = genai.GenerativeModel(gemini_model_name)
+        self.model_name = gemini_model_name
+        self.model = get_model(gemini_model_name, max_output_tokens=500)
+        self.answer_cache = DiskCache("synthesis")
 
-    def synthesize_answer(self, user_question, db_results, doc_content=None):
+    def maybe_direct_answer(self, user_question, db_results, doc_content=None):
+        """
+        Returns a templated answer when the outcome doesn't need the LLM, otherwise None.
+        Without database rows the student can't be identified, which is exactly what the
+        synthesis prompt would be instructed to report.
+        """
+        if db_results is None:
+            return "The student could not be identified because the database query failed. Please try rephrasing the question."
+        if not db_results:
+            return "No student matching the question was found in the database, so no medical record could be looked up."
+        return None
+
+    def synthesize_answer(self, user_question, db_results, doc_content=None, stream=False):
         """
         Synthesizes a human-friendly answer based on query results and document content.
+        With stream=True the answer is printed as Gemini generates it (cached and direct
+        answers are printed whole), so the caller doesn't need to print it again.
         """
-        print("SynthesisAgent: Synthesizing final answer...")
+        direct_answer = self.maybe_direct_answer(user_question, db_results, doc_content)
+        if direct_answer is not None:
+            logger.info("SynthesisAgent: Answer determined without the LLM.")
+            if stream:
+                print(direct_answer)
+            return direct_answer
+
+        logger.info("SynthesisAgent: Synthesizing final answer...")
         
-        prompt_parts = [
-            {"role": "user", "parts": [
-                f"Original User Question: \"{user_question}\"\n\n"
-            ]}
-        ]
+        # Collect the prompt as plain text chunks and send them as a single text part.
+        text_chunks = [SYNTHESIS_INSTRUCTIONS, f"Original User Question: \"{user_question}\"\n\n"]
 
-        if db_results is not None:
-            # Convert db_results to a string representation if it's not already
-            # This handles cases where db_results might be a list of dicts, etc.
-            db_results_str = json.dumps(db_results, indent=2) if isinstance(db_results, (list, dict)) else str(db_results)
-            # Clarified label
-            prompt_parts[0]["parts"].append(f"Database Query Results (identifying the student):\n{db_results_str}\n\n") 
-        else:
-            # Clarified label
-            prompt_parts[0]["parts"].append("Database Query Results: No relevant student identification data found or query failed.\n\n")
+        # maybe_direct_answer has already answered for missing or empty db_results.
+        # Convert db_results to a string representation if it's not already
+        # This handles cases where db_results might be a list of dicts, etc.
+        # Compact JSON: indentation only adds prompt tokens, the model doesn't need it.
+        rows_note = ""
+        if isinstance(db_results, list) and len(db_results) > MAX_PROMPT_ROWS:
+            rows_note = f" (first {MAX_PROMPT_ROWS} of {len(db_results)} rows)"
+            db_results = db_results[:MAX_PROMPT_ROWS]
+        db_results_str = _dumps_compact(db_results) if isinstance(db_results, (list, dict)) else str(db_results)
+        # Clarified label
+        text_chunks.append(f"Database Query Results (identifying the student){rows_note}:\n{db_results_str}\n\n") 
 
         if doc_content:
             # Clarified label
-            prompt_parts[0]["parts"].append(f"Relevant Document Content (medical history details):\n{doc_content}\n\n") 
+            text_chunks.append(f"Relevant Document Content (medical history details):\n{doc_content}\n\n") 
         else:
-            prompt_parts[0]["parts"].append("Relevant Document Content: No relevant document found or content extraction failed.\n\n")
-
-        # --- UPDATED PROMPT INSTRUCTIONS ---
-        prompt_parts[0]["parts"].append(
-            "Based on the 'Original User Question', use the 'Database Query Results' to identify the student by name. "
-            "Then, use this identified student's name to find their corresponding medical history in the 'Relevant Document Content'. "
-            "Finally, extract the *latest* or most relevant medical record for that specific student. "
-            "Provide a concise and clear answer to the original user question. "
-            "If the student cannot be identified or their medical record is not found in the documents, clearly state that. "
-            "Prioritize direct answers if available. "
-            "Output only the answer, no extra text or comments."
-        )
-        # --- END UPDATED PROMPT INSTRUCTIONS ---
-
-        # --- DEBUG PRINT FOR PROMPT_PARTS ---
-        print("\n--- SynthesisAgent: PROMPT PARTS (DEBUG) ---")
-        # Use json.dumps for a more readable output of the list of dicts
-        print(json.dumps(prompt_parts, indent=2))
-        print("--- END PROMPT PARTS (DEBUG) ---\n")
-        # --- END DEBUG PRINT ---         
+            text_chunks.append("Relevant Document Content: No relevant document found or content extraction failed.\n\n")
+
+        prompt_parts = [
+            {"role": "user", "parts": ["".join(text_chunks)]}
+        ]
+
+        # The full prompt is only serialized for inspection when debug logging is on.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("SynthesisAgent: PROMPT PARTS (DEBUG):\n%s", json.dumps(prompt_parts, indent=2))
+
+        cache_key = make_key(self.model_name, SYNTHESIS_PROMPT_VERSION, prompt_parts)
+        cached_answer = self.answer_cache.get(cache_key, max_age=SYNTHESIS_CACHE_TTL)
+        if cached_answer is not None:
+            logger.info("SynthesisAgent: ♻️ Returning cached answer.")
+            if stream:
+                print(cached_answer)
+            return cached_answer
 
         try:
-            response = self.model.generate_content(
-                prompt_parts,
-                generation_config={"max_output_tokens": 500}
-            )
-            return response.text.strip()
+            if stream:
+                chunks = []
+                for chunk in self.model.generate_content(prompt_parts, stream=True):
+                    print(chunk.text, end="", flush=True)
+                    chunks.append(chunk.text)
+                print()
+                answer = "".join(chunks).strip()
+            else:
+                response = self.model.generate_content(prompt_parts)
+                answer = response.text.strip()
+            self.answer_cache.put(cache_key, answer)
+            return answer
         except Exception as e:
-            print(f"SynthesisAgent: Failed to generate summary: {e}")
-            return "An error occurred while trying to synthesize the answer."
\ No newline at end of file
+            logger.error("SynthesisAgent: Failed to generate summary: %s", e)
+            error_answer = "An error occurred while trying to synthesize the answer."
+            if stream:
+                print(error_answer)
+            return error_answer
\ No newline at end of file
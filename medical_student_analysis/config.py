@@ -0,0 +1,51 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Folder holding the medical_history_*.pdf documents
+# My Google Drive URL: https://drive.google.com/drive/u/0/folders/1kC7xJoCO-RcJpj8R7Rc1B1FXOya_8Ayj
+DEFAULT_MEDICAL_HISTORY_FOLDER_ID = "1kC7xJoCO-RcJpj8R7Rc1B1FXOya_8Ayj"
+
+@dataclass(frozen=True)
+class Settings:
+    mysql_host: str
+    mysql_port: int
+    mysql_user: str
+    mysql_password: str
+    mysql_database: str
+    gemini_api_key: str
+    gemini_model: str
+    gemini_transport: str
+    google_service_account_file: str
+    medical_history_folder_id: str
+    log_level: str
+
+    @property
+    def db_config(self):
+        """The connection settings in the dict form DatabaseAgent expects."""
+        return {
+            'host': self.mysql_host,
+            'port': self.mysql_port,
+            'user': self.mysql_user,
+            'password': self.mysql_password,
+            'database': self.mysql_database
+        }
+
+@lru_cache(maxsize=1)
+def get_settings():
+    """Loads the .env file and parses the environment once per process."""
+    load_dotenv()
+    return Settings(
+        mysql_host=os.getenv('MYSQL_HOST', 'localhost'),
+        mysql_port=int(os.getenv('MYSQL_PORT', '3306')),
+        mysql_user=os.getenv('MYSQL_USER', 'root'),
+        mysql_password=os.getenv('MYSQL_PASSWORD'),
+        mysql_database=os.getenv('MYSQL_DATABASE', 'SchoolDb'),
+        gemini_api_key=os.getenv('GEMINI_API_KEY'),
+        gemini_model=os.getenv('GEMINI_MODEL', 'gemini-1.5-flash'),
+        gemini_transport=os.getenv('GEMINI_TRANSPORT', 'grpc'),
+        google_service_account_file=os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE'),
+        medical_history_folder_id=os.getenv('MEDICAL_HISTORY_FOLDER_ID', DEFAULT_MEDICAL_HISTORY_FOLDER_ID),
+        log_level=os.getenv('LOG_LEVEL', 'INFO').upper()
+    )
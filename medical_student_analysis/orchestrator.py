@@ -1,104 +1,114 @@
-import os
-from dotenv import load_dotenv
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
 
+from .config import get_settings
+
 # Import agents
 from .agents.database_agent import DatabaseAgent
-from .agents.document_agent import DocumentAgent
+from .agents.document_agent import DocumentAgent, GOOGLE_DOC_MIME_TYPE
 from .agents.synthesis_agent import SynthesisAgent
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 def main():
     # --- Configuration ---
-    # Database config
-    db_config = {
-        'host': os.getenv('MYSQL_HOST', 'localhost'),
-        'port': int(os.getenv('MYSQL_PORT', '3306')),
-        'user': os.getenv('MYSQL_USER', 'root'),
-        'password': os.getenv('MYSQL_PASSWORD'),
-        'database': os.getenv('MYSQL_DATABASE', 'SchoolDb')
-    }
+    # Parsed once from the environment / .env file
+    settings = get_settings()
+
+    # Agents log through the standard logging module; set LOG_LEVEL=DEBUG to also see
+    # raw LLM responses, generated SQL and the full synthesis prompt.
+    logging.basicConfig(level=settings.log_level, format="%(message)s")
+
+    db_config = settings.db_config
 
     # Gemini config
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    GEMINI_API_KEY = settings.gemini_api_key
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not found in .env")
-    genai.configure(api_key=GEMINI_API_KEY)
-    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    print(f"Orchestrator: Gemini client configured with model: {GEMINI_MODEL}")
+    # gRPC multiplexes concurrent agent calls over one HTTP/2 channel; pin it explicitly
+    # rather than relying on the SDK default. Set GEMINI_TRANSPORT=rest to override.
+    genai.configure(api_key=GEMINI_API_KEY, transport=settings.gemini_transport)
+    GEMINI_MODEL = settings.gemini_model
+    logger.info("Orchestrator: Gemini client configured with model: %s", GEMINI_MODEL)
 
     # Google Drive Service Account File
-    GOOGLE_SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE')
+    GOOGLE_SERVICE_ACCOUNT_FILE = settings.google_service_account_file
     if not GOOGLE_SERVICE_ACCOUNT_FILE:
-        print("Warning: GOOGLE_SERVICE_ACCOUNT_FILE not found in .env. Document agent may not function.")
+        logger.warning("Orchestrator: GOOGLE_SERVICE_ACCOUNT_FILE not found in .env. Document agent may not function.")
 
     # Define the specific folder ID for medical history documents
-    # My Google Drive URL: https://drive.google.com/drive/u/0/folders/1kC7xJoCO-RcJpj8R7Rc1B1FXOya_8Ayj
-    MEDICAL_HISTORY_FOLDER_ID = "1kC7xJoCO-RcJpj8R7Rc1B1FXOya_8Ayj"
+    MEDICAL_HISTORY_FOLDER_ID = settings.medical_history_folder_id
 
     # --- Initialize Agents ---
-    print("\nOrchestrator: Initializing agents...")
+    logger.info("Orchestrator: Initializing agents...")
     db_agent = DatabaseAgent(db_config, GEMINI_MODEL)
-    doc_agent = DocumentAgent(GOOGLE_SERVICE_ACCOUNT_FILE)
+    doc_agent = DocumentAgent(GOOGLE_SERVICE_ACCOUNT_FILE, default_folder_id=MEDICAL_HISTORY_FOLDER_ID)
     synth_agent = SynthesisAgent(GEMINI_MODEL)
 
     # --- Connect to DB and Drive ---
     if not db_agent.connect():
-        print("Orchestrator: Exiting due to database connection failure.")
+        logger.error("Orchestrator: Exiting due to database connection failure.")
         return
 
     # Attempt to initialize Drive service, but allow continuation if it fails (e.g., no relevant files)
     drive_service_initialized = doc_agent.initialize_drive()
 
     # --- Get Schema ---
-    print("\nOrchestrator: Getting database schema...")
+    logger.info("Orchestrator: Getting database schema...")
     schema = db_agent.get_schema()
     if not schema:
-        print("Orchestrator: Failed to retrieve database schema. Exiting.")
+        logger.error("Orchestrator: Failed to retrieve database schema. Exiting.")
         db_agent.disconnect()
         return
-    print("Orchestrator: Schema retrieved successfully.")
+    logger.info("Orchestrator: Schema retrieved successfully.")
 
     # --- User Question ---
     # The comprehensive user question that drives the entire process
     user_question = "Who is the best student in Calculus I? And what is the latest medical record the student?"
-    print(f"\nOrchestrator: User Question: \"{user_question}\"")
+    logger.info("Orchestrator: User Question: \"%s\"", user_question)
 
     # --- Orchestration Logic ---
     db_results = None
     doc_content = None
 
-    # Step 1: Query DatabaseAgent using the full user_question
-    # The DatabaseAgent's LLM will now interpret the entire user_question
-    # to generate the necessary SQL for 'top math performers'.
-    print("\nOrchestrator: Querying DatabaseAgent based on the full user question...")
-    db_results = db_agent.query_database(user_question, schema) # Pass the original user_question
-
-    # Step 2: Get health information from documents
-    if drive_service_initialized:
-        print("\nOrchestrator: Asking DocumentAgent for student health information...")
-        doc_query = "name contains 'medical_history_'"
-        doc_content = doc_agent.find_and_extract_text(
-            file_query=doc_query,
-            mime_type='application/pdf',
-            folder_id=MEDICAL_HISTORY_FOLDER_ID
-        )
-        if doc_content:
-            print("Orchestrator: Document content extracted.")
+    # Steps 1 and 2 are independent I/O-bound calls (Gemini + MySQL vs. Google Drive),
+    # so they run concurrently and the wall time becomes the slower of the two.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Step 1: Query DatabaseAgent using the full user_question
+        # The DatabaseAgent's LLM will now interpret the entire user_question
+        # to generate the necessary SQL for 'top math performers'.
+        logger.info("Orchestrator: Querying DatabaseAgent based on the full user question...")
+        db_future = executor.submit(db_agent.query_database, user_question, schema) # Pass the original user_question
+
+        # Step 2: Get health information from documents
+        doc_future = None
+        if drive_service_initialized:
+            logger.info("Orchestrator: Asking DocumentAgent for student health information...")
+            doc_query = "name contains 'medical_history_'"
+            doc_future = executor.submit(
+                doc_agent.find_and_extract_text,
+                file_query=doc_query,
+                # Records authored in Google Docs are exported as text by Drive, skipping PDF parsing.
+                mime_type=['application/pdf', GOOGLE_DOC_MIME_TYPE]
+            )
         else:
-            print("Orchestrator: No relevant document content found.")
-    else:
-        print("Orchestrator: DocumentAgent not initialized. Skipping document processing.")
+            logger.warning("Orchestrator: DocumentAgent not initialized. Skipping document processing.")
 
+        db_results = db_future.result()
+        if doc_future:
+            doc_content = doc_future.result()
+            if doc_content:
+                logger.info("Orchestrator: Document content extracted.")
+            else:
+                logger.warning("Orchestrator: No relevant document content found.")
 
-    # Step 3: Synthesize the answer
-    print("\nOrchestrator: Passing results to SynthesisAgent for final answer generation...")
-    final_answer = synth_agent.synthesize_answer(user_question, db_results, doc_content)
 
+    # Step 3: Synthesize the answer
+    logger.info("Orchestrator: Passing results to SynthesisAgent for final answer generation...")
     print("\n--- Final Answer ---")
-    print(final_answer)
+    # Streamed so the first tokens show up as soon as Gemini produces them.
+    synth_agent.synthesize_answer(user_question, db_results, doc_content, stream=True)
 
     # --- Cleanup ---
     db_agent.disconnect()
@@ -1,8 +1,19 @@
 import pymysql
 import re
 import os
+from itertools import groupby
+from operator import itemgetter
 import io
 import json
+import hashlib
+import logging
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
 import google.generativeai as genai
 from google.oauth2 import service_account
@@ -11,51 +22,224 @@ from googleapiclient.http import MediaIoBaseDownload
 import PyPDF2
 from datetime import datetime
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Optional speed-up; PyPDF2 is used otherwise.
+    pdfium = None
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib decoder is used otherwise.
+    orjson = None
+
+try:
+    from json_repair import repair_json
+except ImportError:  # Optional; malformed extraction output is dropped without it.
+    repair_json = None
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Per-file and per-chunk progress goes to this logger; it is silent unless
+# LOG_LEVEL is set to INFO or DEBUG
+logger = logging.getLogger(__name__)
+
+# Medical history PDFs downloaded at the same time
+MAX_FILE_WORKERS = 8
+# Tokens of document text sent to Gemini per extraction call (well inside
+# gemini-1.5-pro's context window): each document is fitted to it, and batches
+# are packed up to it. MAX_DOC_CHARS is the fallback cut when tokens can't be counted.
+MAX_DOC_TOKENS = int(os.getenv('MAX_DOC_TOKENS', '800000'))
+MAX_DOC_CHARS = 10000
+# Cap on each extraction reply; a reply cut off at the cap is discarded rather than repaired
+MEDICAL_MAX_OUTPUT_TOKENS = 8192
+# Medical history extractions are cached on disk, keyed by a hash of the prompt
+EXTRACTION_CACHE_PATH = os.getenv(
+    'EXTRACTION_CACHE_PATH',
+    os.path.join(os.path.expanduser("~"), ".cache", "agentic_ai", "medical_history.sqlite3")
+)
+CACHE_TTL_DAYS = float(os.getenv('CACHE_TTL_DAYS', '30'))
+# poppler-utils' pdftotext, when installed, extracts text in a separate process,
+# so parallel downloads don't queue behind the PDFium lock
+PDFTOTEXT_PATH = shutil.which('pdftotext')
+
 # ------------------------
-# 🏥 Medical History Processing
+# 💾 Extraction Cache
 # ------------------------
-def extract_medical_history(pdf_text):
-    """Extract structured medical history from PDF text using LLM."""
-    medical_prompt = f"""
-Extract medical history information from this document and format as JSON:
-{pdf_text[:10000]}  # Limiting to first 10k chars
+_cache_lock = threading.Lock()
+_cache_conn = None
 
-The PDF contains student medical records. Extract:
+def _get_cache_conn():
+    """Open (once) the SQLite file that stores extraction results across runs."""
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(EXTRACTION_CACHE_PATH), exist_ok=True)
+        _cache_conn = sqlite3.connect(EXTRACTION_CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute("PRAGMA journal_mode=WAL")
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT NOT NULL, created_at REAL NOT NULL)")
+    return _cache_conn
+
+def cache_get(key):
+    """Return the cached value for key, or None if it is missing or older than CACHE_TTL_DAYS."""
+    try:
+        with _cache_lock:
+            row = _get_cache_conn().execute("SELECT v, created_at FROM kv WHERE k = ?", (key,)).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("⚠️ Extraction cache read failed: %s", e)
+        return None
+    if row and time.time() - row[1] < CACHE_TTL_DAYS * 86400:
+        return row[0]
+    return None
+
+def cache_set(key, value):
+    """Store value under key; failures are reported but never raised."""
+    try:
+        with _cache_lock:
+            conn = _get_cache_conn()
+            conn.execute("INSERT OR REPLACE INTO kv (k, v, created_at) VALUES (?, ?, ?)", (key, value, time.time()))
+            conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("⚠️ Extraction cache write failed: %s", e)
+
+# ------------------------
+# 🏥 Medical History Processing
+# ------------------------
+MEDICAL_EXTRACTION_SPEC = """Extract:
 1. Each student's full name and email
 2. All medical conditions with dates
 3. Allergies and current medications
 
 Output format:
-{{
+{
     "students": [
-        {{
+        {
             "name": "Full Name",
             "email": "email@domain.com",
             "conditions": [
-                {{
+                {
                     "condition": "Condition Name",
                     "date": "YYYY-MM-DD",
                     "severity": "mild/moderate/severe",
                     "chronic": true/false
-                }}
+                }
             ],
             "allergies": ["Allergen1", "Allergen2"],
             "current_medications": ["Med1", "Med2"]
-        }}
+        }
     ]
-}}
+}
 """
+
+@lru_cache(maxsize=4)
+def get_model(model_name):
+    """Return a shared GenerativeModel per model name instead of building one per call."""
+    return genai.GenerativeModel(model_name)
+
+def _medical_model_name():
+    """Gemini model used for medical history extraction."""
+    return os.getenv("GEMINI_MEDICAL_MODEL", "gemini-1.5-pro")
+
+def count_tokens(text):
+    """Count text's tokens for the medical model, caching the count by a hash of the text."""
+    model_name = _medical_model_name()
+    key = "tokens:" + hashlib.blake2b(f"{model_name}\0{text}".encode('utf-8'), digest_size=16).hexdigest()
+    cached = cache_get(key)
+    if cached is not None:
+        return int(cached)
+    total = get_model(model_name).count_tokens(text).total_tokens
+    cache_set(key, str(total))
+    return total
+
+def fit_to_token_budget(text, budget=MAX_DOC_TOKENS):
+    """
+    Return (text, tokens): text, or the prefix of it that fits in budget tokens by the
+    model's own count, and its token count. A text of at most budget UTF-8 bytes fits
+    without a count, since no token is shorter than a byte; its size stands in for the count.
+    """
+    size = len(text.encode('utf-8'))
+    if size <= budget:
+        return text, size
+    try:
+        tokens = count_tokens(text)
+        while tokens > budget:
+            # Shrink in proportion to the overshoot, with 5% headroom since tokens aren't
+            # spread evenly; the cut is re-counted until it really fits
+            text = text[:int(len(text) * budget / tokens * 0.95)]
+            tokens = count_tokens(text)
+        return text, tokens
+    except Exception as e:
+        logger.warning("⚠️ Token count failed, truncating to %d characters: %s", MAX_DOC_CHARS, e)
+        text = text[:MAX_DOC_CHARS]
+        return text, len(text.encode('utf-8'))
+
+def _generate_medical_json(medical_prompt):
+    """Send an extraction prompt to Gemini and return the raw JSON text (None on failure)."""
+    model_name = _medical_model_name()
+    # Identical prompts (same documents) reuse the earlier result instead of calling Gemini.
+    key = hashlib.blake2b(f"{model_name}\0{medical_prompt}".encode('utf-8'), digest_size=16).hexdigest()
+    cached = cache_get(key)
+    if cached is not None:
+        print("♻️ Using cached medical history extraction")
+        return cached
     try:
-        model = genai.GenerativeModel("gemini-1.5-pro")
-        response = model.generate_content(medical_prompt)
-        return response.text
+        model = get_model(model_name)
+        # JSON mode: Gemini returns bare JSON instead of a Markdown-fenced block,
+        # so the caller's json.loads succeeds without stripping fences first.
+        response = model.generate_content(
+            medical_prompt,
+            generation_config={
+                "response_mime_type": "application/json",
+                "max_output_tokens": MEDICAL_MAX_OUTPUT_TOKENS,
+            }
+        )
+        # A reply that hit the cap is truncated JSON: "repairing" it would silently drop students
+        if response.candidates and response.candidates[0].finish_reason.name == "MAX_TOKENS":
+            print(f"❌ Medical history extraction hit the {MEDICAL_MAX_OUTPUT_TOKENS}-token output cap")
+            return None
+        medical_json = response.text
+        try:
+            json.loads(medical_json)
+            cache_set(key, medical_json)  # only results the caller can actually use
+        except ValueError:
+            pass
+        return medical_json
     except Exception as e:
         print(f"❌ Error extracting medical history: {e}")
         return None
 
+def extract_medical_history(pdf_text):
+    """Extract structured medical history from PDF text (already fitted to the token budget) using LLM."""
+    medical_prompt = f"""
+Extract medical history information from this document and format as JSON:
+{pdf_text}
+
+The PDF contains student medical records. {MEDICAL_EXTRACTION_SPEC}"""
+    return _generate_medical_json(medical_prompt)
+
+def extract_medical_history_batch(docs):
+    """Extract medical history from several (name, text) documents in a single LLM call."""
+    sections = "".join(f"--- DOC: {name} ---\n{text}\n\n" for name, text in docs)
+    medical_prompt = f"""
+Extract medical history information from these {len(docs)} documents and format as one combined JSON:
+
+{sections}Each document contains student medical records. Include the students from every document in a single "students" array. {MEDICAL_EXTRACTION_SPEC}"""
+    return _generate_medical_json(medical_prompt)
+
+def batch_documents(docs, budget=MAX_DOC_TOKENS):
+    """Group (name, text, tokens) documents into batches of (name, text) whose tokens stay within budget."""
+    batch, batch_tokens = [], 0
+    for name, text, tokens in docs:
+        if batch and batch_tokens + tokens > budget:
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((name, text))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+# Points deducted per condition, by severity (unknown severities count as mild)
+SEVERITY_DEDUCTIONS = {'mild': 5, 'moderate': 15, 'severe': 30}
+
 def calculate_health_score(medical_data):
     """Calculate a health score (0-100, higher is better)."""
     if not medical_data or 'students' not in medical_data:
@@ -68,8 +252,7 @@ def calculate_health_score(medical_data):
         
         # Deduct points for conditions
         for condition in student.get('conditions', []):
-            severity_map = {'mild': 5, 'moderate': 15, 'severe': 30}
-            score -= severity_map.get(condition.get('severity', 'mild'), 5)
+            score -= SEVERITY_DEDUCTIONS.get(condition.get('severity', 'mild'), 5)
             if condition.get('chronic', False):
                 score -= 10
                 
@@ -86,36 +269,54 @@ def calculate_health_score(medical_data):
 # ------------------------
 # 📁 Enhanced Google Drive Functions
 # ------------------------
+@lru_cache(maxsize=1)
+def load_drive_credentials():
+    """Load the service account credentials once; they are shared by every Drive client."""
+    service_account_file = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE')
+    
+    if not service_account_file:
+        raise ValueError("GOOGLE_SERVICE_ACCOUNT_FILE not found in .env")
+    
+    print(f"✅ Using service account file: {service_account_file}")
+    
+    return service_account.Credentials.from_service_account_file(
+        service_account_file,
+        scopes=['https://www.googleapis.com/auth/drive.readonly']
+    )
+
+def build_drive_service(credentials):
+    """Build a Drive v3 client from the bundled discovery document (no network fetch)."""
+    return build('drive', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
+
 def initialize_drive_service():
     """Initialize the Google Drive API service with detailed debugging."""
     try:
         print("\n🔧 Initializing Google Drive service...")
-        service_account_file = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE')
-        
-        if not service_account_file:
-            raise ValueError("GOOGLE_SERVICE_ACCOUNT_FILE not found in .env")
-        
-        print(f"✅ Using service account file: {service_account_file}")
-        
-        credentials = service_account.Credentials.from_service_account_file(
-            service_account_file,
-            scopes=['https://www.googleapis.com/auth/drive.readonly']
-        )
-        drive_service = build('drive', 'v3', credentials=credentials)
+        drive_service = build_drive_service(load_drive_credentials())
         print("🚀 Google Drive service initialized successfully")
         return drive_service
     except Exception as e:
         print(f"❌ Failed to initialize Google Drive service: {e}")
         return None
 
+_thread_local = threading.local()
+_pdfium_lock = threading.Lock()
+
+def get_thread_drive_service():
+    """Return this thread's own Drive client; googleapiclient clients are not thread-safe."""
+    drive_service = getattr(_thread_local, 'drive_service', None)
+    if drive_service is None:
+        drive_service = _thread_local.drive_service = build_drive_service(load_drive_credentials())
+    return drive_service
+
 def search_files(drive_service, query, mime_type=None):
     """Search for files in Google Drive with enhanced debugging."""
     try:
-        print(f"\n🔍 Searching files with query: '{query}'")
+        logger.debug("🔍 Searching files with query: '%s'", query)
         params = {
             'q': query,
             'pageSize': 100,
-            'fields': "files(id, name, mimeType, parents)",
+            'fields': "files(id, name, mimeType, parents, md5Checksum, modifiedTime)",
             'includeItemsFromAllDrives': True,
             'supportsAllDrives': True
         }
@@ -124,7 +325,7 @@ def search_files(drive_service, query, mime_type=None):
         
         results = drive_service.files().list(**params).execute()
         files = results.get('files', [])
-        print(f"📂 Found {len(files)} matching files")
+        logger.debug("📂 Found %d matching files", len(files))
         return files
     except Exception as e:
         print(f"❌ Error searching files: {e}")
@@ -144,16 +345,43 @@ def list_folder_contents(drive_service, folder_id=None, folder_name=None):
             print("ℹ️ No files found in this folder")
             return []
             
-        print("\n📋 Folder Contents:")
-        for i, file in enumerate(files, 1):
-            file_type = "📄" if file['mimeType'] != 'application/vnd.google-apps.folder' else "📁"
-            print(f"{i}. {file_type} {file['name']} ({file['id']}) [Type: {file['mimeType']}]")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("📋 Folder Contents:")
+            for i, file in enumerate(files, 1):
+                file_type = "📄" if file['mimeType'] != 'application/vnd.google-apps.folder' else "📁"
+                logger.info("%d. %s %s (%s) [Type: %s]", i, file_type, file['name'], file['id'], file['mimeType'])
         
         return files
     except Exception as e:
         print(f"❌ Error listing folder contents: {e}")
         return []
 
+def extract_pdf_text(file):
+    """Extract the text of every page, preferring pdftotext, then PDFium (C++), then pure-Python PyPDF2."""
+    if PDFTOTEXT_PATH:
+        try:
+            result = subprocess.run(
+                [PDFTOTEXT_PATH, "-enc", "UTF-8", "-", "-"],
+                input=file.getvalue(), capture_output=True, check=True
+            )
+            # pdftotext ends every page with a form feed
+            texts = result.stdout.decode('utf-8', errors='replace').split('\f')[:-1]
+            return "".join(text + "\n" for text in texts), len(texts)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.debug("pdftotext failed, falling back to in-process extraction: %s", e)
+    if pdfium is not None:
+        # PDFium is not thread-safe and downloads run on a thread pool, so extraction is serialized.
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(file)
+            try:
+                texts = [page.get_textpage().get_text_range() for page in pdf]
+            finally:
+                pdf.close()
+    else:
+        pdf_reader = PyPDF2.PdfReader(file)
+        texts = [page.extract_text() or "" for page in pdf_reader.pages]
+    return "".join(text + "\n" for text in texts), len(texts)
+
 def download_pdf(drive_service, file_id, file_name):
     """Download a PDF file with progress tracking."""
     try:
@@ -165,23 +393,69 @@ def download_pdf(drive_service, file_id, file_name):
         done = False
         while not done:
             status, done = downloader.next_chunk()
-            print(f"📥 Download progress: {int(status.progress() * 100)}%")
+            logger.debug("📥 Download progress: %d%%", int(status.progress() * 100))
         
         file.seek(0)
         
-        print("📖 Extracting text from PDF...")
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page_num, page in enumerate(pdf_reader.pages, 1):
-            text += page.extract_text() + "\n"
-            print(f"📄 Processed page {page_num}")
+        logger.debug("📖 Extracting text from PDF...")
+        text, page_count = extract_pdf_text(file)
         
-        print(f"✅ Successfully extracted {len(text)} characters")
+        print(f"✅ Successfully extracted {len(text)} characters from {page_count} pages")
         return text
     except Exception as e:
         print(f"❌ Error downloading/reading PDF: {e}")
         return None
 
+def download_medical_pdf(file):
+    """
+    Download one PDF, extract its text and fit it to the token budget. Runs in a worker
+    thread, so token counting overlaps the other downloads. Returns (file, text, tokens).
+    """
+    print(f"\n⭐ Processing file: {file['name']}")
+    # The text of an unchanged file revision is reused from the cache, skipping the download
+    revision = file.get('md5Checksum') or file.get('modifiedTime')
+    cache_key = f"pdf-text:{file['id']}:{revision}" if revision else None
+    text = cache_get(cache_key) if cache_key else None
+    if text is not None:
+        print(f"♻️ Using cached text for {file['name']}")
+    else:
+        text = download_pdf(get_thread_drive_service(), file['id'], file['name'])
+        if cache_key and text:
+            cache_set(cache_key, text)
+    if not text:
+        return file, text, 0
+    text, tokens = fit_to_token_budget(text)
+    return file, text, tokens
+
+def loads_json(text):
+    """Decode JSON with orjson when available, otherwise the stdlib decoder."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def parse_medical_json(medical_json, source, allow_repair=True):
+    """
+    Parse an extraction result, returning its student records or None if it is unusable.
+    allow_repair=False skips repair_json, for batched results that can be retried per file.
+    """
+    if not medical_json:
+        print(f"❌ No extraction result for {source}")
+        return None
+    try:
+        try:
+            return loads_json(medical_json).get('students', [])
+        except ValueError:
+            # The LLM call has already been paid for; try to salvage slightly malformed output.
+            if repair_json is None or not allow_repair:
+                raise
+            print(f"🩹 Repairing malformed JSON from {source}")
+            return loads_json(repair_json(medical_json)).get('students', [])
+    except ValueError as e:
+        print(f"❌ Error parsing JSON from {source}: {e}")
+    except Exception as e:
+        print(f"❌ Error processing {source}: {e}")
+    return None
+
 def process_medical_files(drive_service, folder_id="root"):
     """Process medical history files from Google Drive."""
     try:
@@ -206,28 +480,36 @@ def process_medical_files(drive_service, folder_id="root"):
         for i, file in enumerate(pdf_files, 1):
             print(f"{i}. {file['name']} (ID: {file['id']})")
         
-        # Process all files
+        # Download all files concurrently; map() keeps the results in file order.
         all_medical_data = {'students': []}
         
-        for file in pdf_files:
-            print(f"\n⭐ Processing file: {file['name']}")
-            file_content = download_pdf(drive_service, file['id'], file['name'])
-            
+        with ThreadPoolExecutor(max_workers=min(MAX_FILE_WORKERS, len(pdf_files))) as executor:
+            downloads = list(executor.map(download_medical_pdf, pdf_files))
+        
+        docs = []
+        for file, file_content, tokens in downloads:
             if not file_content:
                 print(f"❌ Failed to process {file['name']}")
                 continue
-                
-            medical_json = extract_medical_history(file_content)
+            docs.append((file['name'], file_content, tokens))
+        
+        # One Gemini call per batch of documents instead of one per file. If a combined
+        # response can't be parsed, retry that batch file by file: a repaired batch reply
+        # could silently lose whole documents, so only single-file replies are repaired.
+        for batch in batch_documents(docs):
+            names = ", ".join(name for name, _ in batch)
+            students = parse_medical_json(extract_medical_history_batch(batch), names, allow_repair=False)
+            if students is not None:
+                all_medical_data['students'].extend(students)
+                print(f"✅ Added {len(students)} student records from {names}")
+                continue
             
-            if medical_json:
-                try:
-                    medical_data = json.loads(medical_json)
-                    all_medical_data['students'].extend(medical_data.get('students', []))
-                    print(f"✅ Added {len(medical_data.get('students', []))} student records")
-                except json.JSONDecodeError as e:
-                    print(f"❌ Error parsing JSON from {file['name']}: {e}")
-                except Exception as e:
-                    print(f"❌ Error processing {file['name']}: {e}")
+            print("⚠️ Batched extraction failed, falling back to one call per file")
+            for name, text in batch:
+                students = parse_medical_json(extract_medical_history(text), name)
+                if students is not None:
+                    all_medical_data['students'].extend(students)
+                    print(f"✅ Added {len(students)} student records from {name}")
         
         if not all_medical_data['students']:
             print("❌ No valid student medical records found")
@@ -245,96 +527,95 @@ def process_medical_files(drive_service, folder_id="root"):
 # ------------------------
 def get_db_schema(cursor):
     """Introspects the MySQL database to retrieve schema information."""
-    schema = ""
-    cursor.execute("SHOW TABLES")
+    # One round-trip for every table's columns instead of SHOW TABLES + SHOW COLUMNS per table
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """,
+        (os.getenv('MYSQL_DATABASE', 'SchoolDb'),)
+    )
     
-    tables = []
-    fetched_tables = cursor.fetchall()
-    if fetched_tables:
-        if isinstance(fetched_tables[0], dict):
-            db_name = os.getenv('MYSQL_DATABASE', 'SchoolDb')
-            tables = [row["Tables_in_" + db_name] for row in fetched_tables]
-        else:
-            tables = [row[0] for row in fetched_tables]
-
-    for table in tables:
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        
-        for column in columns:
-            if isinstance(column, dict):
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:
-                column_name = column[0]
-                data_type = column[1]
-                
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
-
-def get_top_math_students(cursor, limit=10):
-    """Get top math students from the database."""
-    query = """
-    SELECT s.student_id, s.first_name, s.last_name, s.email, e.score as math_score
-    FROM Students s
-    JOIN Enrollments e ON s.student_id = e.student_id
-    JOIN Courses c ON e.course_id = c.course_id
-    WHERE c.course_name LIKE '%Math%'
-    ORDER BY e.score DESC
-    LIMIT %s;
-    """
-    try:
-        cursor.execute(query, (limit,))
-        return cursor.fetchall()
-    except Exception as e:
-        print(f"❌ Error fetching math students: {e}")
-        return None
+    parts = []
+    for table, columns in groupby(cursor.fetchall(), key=itemgetter('table_name')):
+        parts.append(f"Table: {table}\n")
+        parts.extend(f"- {column['column_name']} ({column['column_type']})\n" for column in columns)
+        parts.append("\n")
+    return "".join(parts).strip()
+
+# Math courses are coded MATH101, MATH201, ...; a prefix match can use the
+# unique index on Courses.course_code instead of scanning every course name.
+MATH_COURSE_CODE_PATTERN = 'MATH%'
 
 # ------------------------
 # 🎯 Analysis Functions
 # ------------------------
-def find_healthiest_top_student(cursor, health_scores):
+def find_healthiest_top_student(cursor, health_scores, limit=10):
     """Find the healthiest student among top math performers."""
     if not health_scores:
         print("❌ No health scores available")
         return None
-    
-    # Get top math students
-    math_students = get_top_math_students(cursor)
-    if not math_students:
-        print("❌ No math students found")
+
+    # Load the scores into a session-scoped table so the join and the
+    # combined score (70% math, 30% health) are computed by MySQL, which
+    # then returns only the winning row.
+    try:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS HealthScores")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE HealthScores (email VARCHAR(255) PRIMARY KEY, score INT)"
+        )
+        cursor.executemany(
+            "INSERT INTO HealthScores (email, score) VALUES (%s, %s)",
+            list(health_scores.items())
+        )
+        # The derived table keeps the original semantics: the pick is made
+        # among the top math students only, not across every enrollment.
+        cursor.execute(
+            """
+            SELECT t.student_id, t.first_name, t.last_name, LOWER(t.email) AS email,
+                   t.math_score, h.score AS health_score,
+                   t.math_score * 0.7 + h.score * 0.3 AS combined_score
+            FROM (
+                SELECT s.student_id, s.first_name, s.last_name, s.email, e.score AS math_score
+                FROM Students s
+                JOIN Enrollments e ON s.student_id = e.student_id
+                JOIN Courses c ON e.course_id = c.course_id
+                WHERE c.course_code LIKE %s
+                ORDER BY e.score DESC
+                LIMIT %s
+            ) t
+            JOIN HealthScores h ON h.email = LOWER(t.email)
+            ORDER BY combined_score DESC, t.math_score DESC
+            LIMIT 1
+            """,
+            (MATH_COURSE_CODE_PATTERN, limit)
+        )
+        student = cursor.fetchone()
+    except Exception as e:
+        print(f"❌ Error ranking math students: {e}")
         return None
-    
-    print(f"\n🔢 Found {len(math_students)} top math students")
-    
-    # Find students with health data
-    results = []
-    for student in math_students:
-        email = student['email'].lower()
-        if email in health_scores:
-            results.append({
-                'student_id': student['student_id'],
-                'name': f"{student['first_name']} {student['last_name']}",
-                'email': email,
-                'math_score': student['math_score'],
-                'health_score': health_scores[email],
-                'combined_score': (student['math_score'] * 0.7) + (health_scores[email] * 0.3)
-            })
-    
-    if not results:
+
+    if student is None:
         print("❌ No matching students found between DB and medical records")
         return None
-    
-    # Sort by combined score (70% math, 30% health)
-    results.sort(key=lambda x: x['combined_score'], reverse=True)
-    return results[0]
+
+    return {
+        'student_id': student['student_id'],
+        'name': f"{student['first_name']} {student['last_name']}",
+        'email': student['email'],
+        'math_score': student['math_score'],
+        'health_score': student['health_score'],
+        'combined_score': float(student['combined_score'])
+    }
 
 # ------------------------
 # 🚀 MAIN SCRIPT
 # ------------------------
 def main():
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format="%(message)s")
+
     # Initialize database connection
     try:
         conn = pymysql.connect(
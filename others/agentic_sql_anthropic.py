@@ -1,64 +1,17 @@
 import pymysql
-import re
 import os
 from dotenv import load_dotenv
 import anthropic
+from agentic_sql_common import get_db_schema, get_cached_result, cache_result, extract_valid_sql, digest_rows, MAX_RESULT_ROWS
 
 # Load environment variables from .env file
 load_dotenv()
 
-# ------------------------
-# 🔍 Get DB schema (Updated for MySQL)
-# ------------------------
-def get_db_schema(cursor):
-    """
-    Introspects the MySQL database to retrieve schema information.
-    Args:
-        cursor: A pymysql cursor object connected to the database.
-    Returns:
-        A formatted string representing the database schema.
-    """
-    schema = ""
-
-    # Fetch all tables in the current database
-    cursor.execute("SHOW TABLES")
-    
-    # Handle both DictCursor and regular cursor cases
-    try:
-        # For DictCursor (keys are column names)
-        tables = [row["Tables_in_" + os.getenv('MYSQL_DATABASE', 'SchoolDb')] for row in cursor.fetchall()]
-    except KeyError:
-        # For regular cursor (numeric indices)
-        cursor.execute("SHOW TABLES")
-        tables = [row[0] for row in cursor.fetchall()]
-
-    # For each table, fetch its columns and their data types
-    for table in tables:
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")  # Added backticks for safety
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        
-        # Handle both DictCursor and regular cursor for columns
-        for column in columns:
-            if isinstance(column, dict):  # DictCursor case
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:  # Regular cursor case
-                column_name = column[0]
-                data_type = column[1]
-                
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
-
 # ------------------------
 # 🧠 Build LLM prompt (updated for MySQL compatibility)
 # ------------------------
-def build_prompt(user_question, schema, error_message=None, previous_sql=None):
-    """
-    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
-    """
-    system_message_content = """
+# Fixed rules for SQL generation, sent as the request's system prompt
+SQL_SYSTEM_PROMPT = """
 You are a SQL expert. You will receive a database schema and a user question.
 Your task is to generate a valid MySQL SELECT query that answers the user's question.
 
@@ -71,6 +24,10 @@ You MUST adhere to these rules:
 - Use LIMIT instead of TOP for row limiting.
 """
 
+def build_prompt(user_question, schema, error_message=None, previous_sql=None):
+    """
+    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
+    """
     user_message_content = f"""
 Schema:
 {schema}
@@ -100,25 +57,6 @@ Try again. ONLY use the tables and columns listed in this schema.
     
     return messages
 
-# ------------------------
-# 🧼 Extract SELECT statement (updated for MySQL)
-# ------------------------
-def extract_valid_sql(text):
-    """
-    Extracts a valid SQL SELECT statement from the LLM's response.
-    Now validates for MySQL compatibility.
-    """
-    match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
-    if not match:
-        raise ValueError("No valid SELECT statement found in LLM response.")
-    sql = match.group(1).strip()
-    
-    # Basic MySQL validation
-    if "TOP" in sql.upper():
-        raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
-    
-    return sql
-
 # ------------------------
 # 🚀 MAIN SCRIPT
 # ------------------------
@@ -166,7 +104,13 @@ error_message = None
 sql_query = None
 data = None
 
-while attempt < MAX_RETRIES:
+# A recently answered question skips both the LLM and the database
+cached = get_cached_result(user_question, schema, f"anthropic/{ANTHROPIC_MODEL}")
+if cached:
+    sql_query, data = cached
+    print("♻️ Using cached result:\n", sql_query)
+
+while data is None and attempt < MAX_RETRIES:
     print(f"\n--- Attempt {attempt + 1} ---")
     prompt_messages = build_prompt(user_question, schema, error_message, sql_query)
     
@@ -174,6 +118,7 @@ while attempt < MAX_RETRIES:
         response = client.messages.create(
             model=ANTHROPIC_MODEL,
             max_tokens=200,
+            system=SQL_SYSTEM_PROMPT,
             messages=prompt_messages
         )
         raw_response = response.content[0].text.strip()
@@ -184,12 +129,10 @@ while attempt < MAX_RETRIES:
 
         # Execute the SQL query
         cursor.execute(sql_query)
-        data = cursor.fetchall()  # Using DictCursor so we get dictionaries directly
-
-        if not data:
-            raise ValueError("Query ran successfully but returned no results.")
+        data = cursor.fetchmany(MAX_RESULT_ROWS)  # Using DictCursor so we get dictionaries directly
 
         print("Query executed successfully.")
+        cache_result(user_question, schema, f"anthropic/{ANTHROPIC_MODEL}", sql_query, data)
         break
 
     except ValueError as ve:
@@ -213,7 +156,7 @@ while attempt < MAX_RETRIES:
 if data:
     print("\n--- Final Result ---")
     summary_user_message = f"""
-Here are the results of the query:\n{data}
+Here are the results of the query:\n{digest_rows(data)}
 Summarize this nicely for the user.
 """
     summary_messages = [{"role": "user", "content": summary_user_message}]
@@ -229,6 +172,10 @@ Summarize this nicely for the user.
     except Exception as e:
         print(f"Failed to generate summary: {e}")
         print("Raw Data:", data)
+elif data is not None:
+    # An empty result is a valid answer; no summary call is needed to say so
+    print("\n--- Final Result ---")
+    print("📄 Summary:\n", "No records match the question.")
 else:
     print("\n❌ Failed after retries. Please rephrase your question or check the database/schema.")
 
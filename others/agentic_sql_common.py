@@ -0,0 +1,233 @@
+"""
+Helpers shared by the agentic_sql_* scripts: schema introspection, the
+question/result cache, SQL extraction from model replies and the row digest
+used in summary prompts. Only the model calls and prompts differ per script.
+"""
+import re
+import os
+import json
+import csv
+import io
+import hashlib
+import time
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+# Answered questions (SQL + rows) are reused for RESULT_CACHE_TTL seconds, keyed by question, schema and model
+RESULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "agentic_sql")
+RESULT_CACHE_TTL = 600
+
+# ------------------------
+# 🔍 Get DB schema (MySQL)
+# ------------------------
+def get_db_schema(cursor):
+    """
+    Introspects the MySQL database to retrieve schema information.
+    Args:
+        cursor: A pymysql cursor object connected to the database.
+    Returns:
+        A formatted string representing the database schema.
+    """
+    # One round-trip for every table's columns instead of SHOW TABLES + SHOW COLUMNS per table
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
+    )
+
+    # Handle both DictCursor and regular cursor cases
+    rows = [
+        (row["table_name"], row["column_name"], row["column_type"]) if isinstance(row, dict) else row
+        for row in cursor.fetchall()
+    ]
+
+    # One compact line per table, e.g. Students(student_id:int, email:varchar(100)), to keep prompts short
+    lines = []
+    for table, columns in groupby(rows, key=itemgetter(0)):
+        lines.append(f"{table}(" + ", ".join(f"{column_name}:{data_type}" for _, column_name, data_type in columns) + ")")
+    return "\n".join(lines)
+
+# ------------------------
+# ♻️ Question/result cache
+# ------------------------
+def _result_cache_path(user_question, schema, model_name):
+    """
+    Cache file for a question, normalized for case and whitespace, asked against this schema.
+    model_name ("provider/model") is part of the key, so one script never serves another's SQL.
+    """
+    normalized = re.sub(r"\s+", " ", user_question.strip().lower())
+    key = hashlib.sha256(f"{model_name}\0{normalized}\0{schema}".encode("utf-8")).hexdigest()
+    return os.path.join(RESULT_CACHE_DIR, f"{key}.json")
+
+def get_cached_result(user_question, schema, model_name):
+    """Return (sql, rows) from an earlier run of the same question and model, or None if missing or expired"""
+    try:
+        with open(_result_cache_path(user_question, schema, model_name), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached['ts'] < RESULT_CACHE_TTL:
+            return cached['sql'], cached['rows']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def cache_result(user_question, schema, model_name, sql, rows):
+    """Store a question's SQL and rows; a failed write is reported, never raised"""
+    cache_path = _result_cache_path(user_question, schema, model_name)
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'ts': time.time(), 'sql': sql, 'rows': rows}, f, default=str)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError) as e:
+        print(f"⚠️ Could not write result cache: {e}")
+
+# ------------------------
+# 🧼 Extract SELECT statement (MySQL)
+# ------------------------
+# Compiled once at import instead of on every LLM response
+# A SELECT opening a line or a fence starts the statement; prose like "To select students; ..." doesn't
+_SQL_START_RE = re.compile(r"(?:^|(?<=`)|(?<=```sql))[ \t]*(SELECT\s)", re.IGNORECASE | re.MULTILINE)
+_SQL_ANYWHERE_RE = re.compile(r"\b(SELECT\s)", re.IGNORECASE)
+_THINK_RE = re.compile(r"<think>.*?</think>", re.IGNORECASE | re.DOTALL)
+_FENCE_RE = re.compile(r"```(?:sql)?\s*(.+?)```", re.IGNORECASE | re.DOTALL)
+_FENCE_MARK_RE = re.compile(r"```(?:sql)?", re.IGNORECASE)
+_TOP_RE = re.compile(r"\bTOP\b", re.IGNORECASE)  # whole word, so LAPTOP or STOP_DATE pass
+# String literals, quoted identifiers and MySQL comments (--, # and /* */), each possibly unterminated
+_SQL_LITERAL_OR_COMMENT_RE = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'?|"(?:[^"\\]|\\.|"")*"?|`(?:[^`]|``)*`?|--(?=\s|$)[^\n]*|#[^\n]*|/\*.*?(?:\*/|$)""",
+    re.DOTALL,
+)
+# Parentheses and LIMIT keywords, scanned to find a LIMIT outside any subquery
+_LIMIT_SCAN_RE = re.compile(r"[()]|\bLIMIT\b", re.IGNORECASE)
+# LIMIT count, or LIMIT offset, count
+_LIMIT_COUNT_RE = re.compile(r"LIMIT\s+(\d+)(?:\s*,\s*(\d+))?", re.IGNORECASE)
+# Upper bound on rows fetched per query (and pasted into any summary prompt)
+MAX_RESULT_ROWS = 200
+
+def _mask_literals_and_comments(text):
+    """Blanks out string literals, quoted identifiers and comments, keeping every other character's position"""
+    return _SQL_LITERAL_OR_COMMENT_RE.sub(lambda m: " " * len(m.group(0)), text)
+
+def _terminated_statement(text):
+    """
+    Returns text up to and including its first semicolon outside string literals,
+    quoted identifiers and comments, or None while no such semicolon has arrived.
+    """
+    end = _mask_literals_and_comments(text).find(";")
+    return text[:end + 1] if end != -1 else None
+
+def sql_is_complete(text):
+    """True once text holds a full SELECT statement outside any unfinished <think> block."""
+    text = _THINK_RE.sub("", text)
+    if "<think>" in text.lower():
+        return False
+    start = _SQL_START_RE.search(text)
+    return start is not None and _terminated_statement(text[start.start(1):]) is not None
+
+def _strip_sql_comments(sql):
+    """Replaces each comment outside string literals and quoted identifiers with a space"""
+    return _SQL_LITERAL_OR_COMMENT_RE.sub(lambda m: m.group(0) if m.group(0)[0] in "'\"`" else " ", sql)
+
+def _top_level_limit(sql):
+    """Position of sql's own LIMIT keyword, not one inside a subquery, string or comment; None if it has none"""
+    depth = 0
+    for match in _LIMIT_SCAN_RE.finditer(_mask_literals_and_comments(sql)):
+        token = match.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            return match.start()
+    return None
+
+def extract_valid_sql(text):
+    """
+    Extracts a valid SQL SELECT statement from the LLM's response.
+    Validates for MySQL compatibility.
+    Raises:
+        ValueError: If no valid SELECT statement is found or if invalid keywords are present.
+    """
+    # Reasoning models may think out loud first, and the SQL often arrives in a Markdown fence
+    text = _THINK_RE.sub("", text)
+    # Structured replies carry the statement as {"sql": "..."}
+    if text.lstrip().startswith("{"):
+        try:
+            reply = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"Structured reply is not valid JSON: {e}") from e
+        sql = reply.get("sql") if isinstance(reply, dict) else None
+        if not isinstance(sql, str):
+            raise ValueError('Structured reply has no "sql" string field.')
+        text = sql
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    else:
+        # An unmatched fence (a reply cut off mid-block, or a stray closing one) still delimits the SQL:
+        # keep the first piece holding a SELECT, so neither the marker nor prose past it is parsed
+        pieces = _FENCE_MARK_RE.split(text)
+        text = next((piece for piece in pieces if _SQL_ANYWHERE_RE.search(piece)), text)
+    start = _SQL_START_RE.search(text) or _SQL_ANYWHERE_RE.search(text)
+    if not start:
+        raise ValueError("No valid SELECT statement found in LLM response.")
+    text = text[start.start(1):]
+    sql = _terminated_statement(text)
+    if sql is not None:
+        sql = sql.strip()
+    else:
+        # A statement missing only its trailing semicolon is repaired here instead of costing a retry
+        sql = text.strip() + ";"
+
+    # Basic MySQL validation
+    if _TOP_RE.search(sql):
+        raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
+
+    # Generated queries without a LIMIT get one, so a bare SELECT * can't pull a whole table.
+    # Comments go first: a trailing "-- ..." would otherwise swallow the appended clause.
+    limit_at = _top_level_limit(sql)
+    if limit_at is None:
+        sql = f"{_strip_sql_comments(sql).rstrip().rstrip(';').rstrip()} LIMIT {MAX_RESULT_ROWS};"
+    else:
+        # A larger LIMIT the model wrote itself is lowered too: the buffered cursor would fetch every row
+        # even though only MAX_RESULT_ROWS are read, and the digest would report those as the total
+        match = _LIMIT_COUNT_RE.match(sql, limit_at)
+        count = 2 if match and match.group(2) else 1
+        if match and int(match.group(count)) > MAX_RESULT_ROWS:
+            sql = f"{sql[:match.start(count)]}{MAX_RESULT_ROWS}{sql[match.end(count):]}"
+
+    return sql
+
+# ------------------------
+# 📊 Summarize query results
+# ------------------------
+# Rows shown verbatim to the summary model; the rest is described by count and numeric ranges
+SUMMARY_PREVIEW_ROWS = 10
+
+def digest_rows(rows, preview_rows=SUMMARY_PREVIEW_ROWS):
+    """
+    Describes query results compactly for the summary prompt: the row count, a CSV
+    preview of the first rows and, when rows are left out, min/max/mean per numeric column.
+    """
+    rows = list(rows)
+    if not rows:
+        return "rows=0"
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows([row[column] for column in columns] for row in rows[:preview_rows])
+    parts = [f"rows={len(rows)}" + (f" (first {preview_rows} shown)" if len(rows) > preview_rows else ""), buffer.getvalue().rstrip("\n")]
+
+    if len(rows) > preview_rows:
+        for column in columns:
+            values = [row[column] for row in rows if row[column] is not None]
+            if values and all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in values):
+                mean = sum(float(v) for v in values) / len(values)
+                parts.append(f"{column}: min={min(values)}, max={max(values)}, mean={mean:.2f}")
+    return "\n".join(parts).strip()
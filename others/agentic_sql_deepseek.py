@@ -1,72 +1,26 @@
 import pymysql
-import re
 import os
 import requests
 from dotenv import load_dotenv
+from agentic_sql_common import get_db_schema, get_cached_result, cache_result, extract_valid_sql, MAX_RESULT_ROWS
 
 # Load environment variables
 load_dotenv()
 
-# ------------------------
-# 🔍 Database Functions
-# ------------------------
-def get_db_schema(cursor):
-    """Get database schema as formatted string"""
-    schema = ""
-    cursor.execute("SHOW TABLES")
-    try:
-        tables = [row["Tables_in_" + os.getenv('MYSQL_DATABASE', 'SchoolDb')] for row in cursor.fetchall()]
-    except KeyError:
-        cursor.execute("SHOW TABLES")
-        tables = [row[0] for row in cursor.fetchall()]
-
-    for table in tables:
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        for column in columns:
-            if isinstance(column, dict):
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:
-                column_name = column[0]
-                data_type = column[1]
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
-
-# ------------------------
-# 🧼 SQL Validation
-# ------------------------
-def extract_valid_sql(text):
-    """
-    Extracts and validates SQL from LLM response
-    Returns: Valid SQL string
-    Raises: ValueError if invalid
-    """
-    match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
-    if not match:
-        raise ValueError("No valid SELECT statement found in response")
-    
-    sql = match.group(1).strip()
-    
-    # MySQL-specific validation
-    if "TOP" in sql.upper():
-        raise ValueError("Use LIMIT instead of TOP for MySQL")
-    
-    return sql
+# One pooled HTTP session so repeated API calls reuse the TCP/TLS connection
+DEEPSEEK_SESSION = requests.Session()
+DEEPSEEK_SESSION.headers.update({"Content-Type": "application/json"})
+DEEPSEEK_TIMEOUT = 30  # seconds
+DEEPSEEK_MODEL = "deepseek-chat"
 
 # ------------------------
 # 🤖 DeepSeek API
 # ------------------------
-def call_deepseek_api(prompt: str, api_key: str, model: str = "deepseek-chat"):
+def call_deepseek_api(prompt: str, api_key: str, model: str = DEEPSEEK_MODEL):
     """Call DeepSeek API and return response"""
     url = "https://api.deepseek.com/v1/chat/completions"
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {api_key}"}
     
     payload = {
         "model": model,
@@ -75,7 +29,7 @@ def call_deepseek_api(prompt: str, api_key: str, model: str = "deepseek-chat"):
         "max_tokens": 200
     }
     
-    response = requests.post(url, headers=headers, json=payload)
+    response = DEEPSEEK_SESSION.post(url, headers=headers, json=payload, timeout=DEEPSEEK_TIMEOUT)
     response.raise_for_status()
     return response.json()["choices"][0]["message"]["content"]
 
@@ -137,15 +91,22 @@ def main():
     
     # Generate and execute SQL
     try:
-        prompt = build_prompt(user_question, schema)
-        print("\nGenerating SQL...")
-        raw_response = call_deepseek_api(prompt, DEEPSEEK_API_KEY)
-        
-        sql_query = extract_valid_sql(raw_response)  # Now properly defined
-        print(f"Generated SQL:\n{sql_query}")
-
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
+        # A recently answered question skips both the API and the database
+        cached = get_cached_result(user_question, schema, f"deepseek/{DEEPSEEK_MODEL}")
+        if cached:
+            sql_query, results = cached
+            print(f"♻️ Using cached result for:\n{sql_query}")
+        else:
+            prompt = build_prompt(user_question, schema)
+            print("\nGenerating SQL...")
+            raw_response = call_deepseek_api(prompt, DEEPSEEK_API_KEY)
+            
+            sql_query = extract_valid_sql(raw_response)  # Now properly defined
+            print(f"Generated SQL:\n{sql_query}")
+
+            cursor.execute(sql_query)
+            results = cursor.fetchmany(MAX_RESULT_ROWS)
+            cache_result(user_question, schema, f"deepseek/{DEEPSEEK_MODEL}", sql_query, results)
         
         if results:
             print("\nResults:")
@@ -1,75 +1,34 @@
 import pymysql
-import re
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai  # Changed from anthropic to google.generativeai
+from agentic_sql_common import get_db_schema, get_cached_result, cache_result, extract_valid_sql, digest_rows, MAX_RESULT_ROWS
 
 # Load environment variables from .env file
 load_dotenv()
 
-# ------------------------
-# 🔍 Get DB schema (Updated for MySQL)
-# ------------------------
-def get_db_schema(cursor):
-    """
-    Introspects the MySQL database to retrieve schema information.
-    Args:
-        cursor: A pymysql cursor object connected to the database.
-    Returns:
-        A formatted string representing the database schema.
-    """
-    schema = ""
-
-    # Fetch all tables in the current database
-    cursor.execute("SHOW TABLES")
-    
-    # Handle both DictCursor and regular cursor cases
-    try:
-        # For DictCursor (keys are column names)
-        tables = [row["Tables_in_" + os.getenv('MYSQL_DATABASE', 'SchoolDb')] for row in cursor.fetchall()]
-    except KeyError:
-        # For regular cursor (numeric indices)
-        cursor.execute("SHOW TABLES")
-        tables = [row[0] for row in cursor.fetchall()]
-
-    # For each table, fetch its columns and their data types
-    for table in tables:
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")  # Added backticks for safety
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        
-        # Handle both DictCursor and regular cursor for columns
-        for column in columns:
-            if isinstance(column, dict):  # DictCursor case
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:  # Regular cursor case
-                column_name = column[0]
-                data_type = column[1]
-                
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
-
 # ------------------------
 # 🧠 Build LLM prompt (updated for MySQL compatibility)
 # ------------------------
-def build_prompt(user_question, schema, error_message=None, previous_sql=None):
-    """
-    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
-    """
-    prompt = """
+# Fixed rules that open every SQL prompt
+SQL_SYSTEM_INSTRUCTION = """
 You are a SQL expert. You will receive a database schema and a user question.
 Your task is to generate a valid MySQL SELECT query that answers the user's question.
 
 You MUST adhere to these rules:
 - Use ONLY table and column names exactly as provided in the schema.
 - NEVER invent or singularize table names (e.g., use 'Students' if that's in the schema, not 'Student').
-- Output ONLY a valid MySQL SELECT statement, ending with a semicolon.
-- Do NOT include any explanations, comments, or additional text outside of the SQL query.
+- Reply with a JSON object whose "sql" field holds one valid MySQL SELECT statement, ending with a semicolon.
+- Do NOT include any explanations or comments, inside the "sql" field or outside the JSON object.
 - Use backticks (`) for quoting identifiers if they contain special characters.
 - Use LIMIT instead of TOP for row limiting.
+"""
 
+def build_prompt(user_question, schema, error_message=None, previous_sql=None):
+    """
+    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
+    """
+    prompt = SQL_SYSTEM_INSTRUCTION + f"""
 Schema:
 {schema}
 
@@ -95,23 +54,15 @@ Try again. ONLY use the tables and columns listed in this schema.
     return prompt
 
 # ------------------------
-# 🧼 Extract SELECT statement (updated for MySQL)
+# 🧼 Structured SQL reply
 # ------------------------
-def extract_valid_sql(text):
-    """
-    Extracts a valid SQL SELECT statement from the LLM's response.
-    Now validates for MySQL compatibility.
-    """
-    match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
-    if not match:
-        raise ValueError("No valid SELECT statement found in LLM response.")
-    sql = match.group(1).strip()
-    
-    # Basic MySQL validation
-    if "TOP" in sql.upper():
-        raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
-    
-    return sql
+# Structured output: the reply is {"sql": "..."}, with no fences or commentary to strip
+SQL_GENERATION_CONFIG = {
+    # gemini-2.5-pro's thinking tokens count against this cap too, and can run to several thousand
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "object", "properties": {"sql": {"type": "string"}}, "required": ["sql"]},
+}
 
 # ------------------------
 # 🚀 MAIN SCRIPT
@@ -141,7 +92,8 @@ if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found. Please set it in your .env file.")
 
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-pro')
+GEMINI_MODEL = 'gemini-2.5-pro'
+model = genai.GenerativeModel(GEMINI_MODEL)
 print("Gemini client initialized successfully")
 
 # Step 2: User question
@@ -161,13 +113,18 @@ error_message = None
 sql_query = None
 data = None
 
-while attempt < MAX_RETRIES:
+# A recently answered question skips both the LLM and the database
+cached = get_cached_result(user_question, schema, f"gemini/{GEMINI_MODEL}")
+if cached:
+    sql_query, data = cached
+    print("♻️ Using cached result:\n", sql_query)
+
+while data is None and attempt < MAX_RETRIES:
     print(f"\n--- Attempt {attempt + 1} ---")
     prompt = build_prompt(user_question, schema, error_message, sql_query)
     
     try:
-        response = model.generate_content(prompt)
-        raw_response = response.text.strip()
+        raw_response = model.generate_content(prompt, generation_config=SQL_GENERATION_CONFIG).text.strip()
         print(f"🔍 LLM Raw Response:\n{raw_response}")
 
         sql_query = extract_valid_sql(raw_response)
@@ -175,12 +132,10 @@ while attempt < MAX_RETRIES:
 
         # Execute the SQL query
         cursor.execute(sql_query)
-        data = cursor.fetchall()
-
-        if not data:
-            raise ValueError("Query ran successfully but returned no results.")
+        data = cursor.fetchmany(MAX_RESULT_ROWS)
 
         print("Query executed successfully.")
+        cache_result(user_question, schema, f"gemini/{GEMINI_MODEL}", sql_query, data)
         break
 
     except ValueError as ve:
@@ -200,7 +155,7 @@ while attempt < MAX_RETRIES:
 if data:
     print("\n--- Final Result ---")
     summary_prompt = f"""
-Here are the results of the query:\n{data}
+Here are the results of the query:\n{digest_rows(data)}
 Summarize this nicely for the user.
 """
     try:
@@ -210,6 +165,10 @@ Summarize this nicely for the user.
     except Exception as e:
         print(f"Failed to generate summary: {e}")
         print("Raw Data:", data)
+elif data is not None:
+    # An empty result is a valid answer; no summary call is needed to say so
+    print("\n--- Final Result ---")
+    print("📄 Summary:\n", "No records match the question.")
 else:
     print("\n❌ Failed after retries. Please rephrase your question or check the database/schema.")
 
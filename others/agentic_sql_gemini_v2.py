@@ -1,64 +1,36 @@
 import pymysql
-import re
 import os
+import logging
 from dotenv import load_dotenv
 import google.generativeai as genai
+from agentic_sql_common import get_db_schema, get_cached_result, cache_result, extract_valid_sql, digest_rows, MAX_RESULT_ROWS
 
 # Load environment variables from .env file
 # This is crucial for securely managing your API keys and other configurations.
 load_dotenv()
 
-# ------------------------
-# 🔍 Get DB schema
-# ------------------------
-def get_db_schema(cursor):
-    """
-    Introspects the MySQL database to retrieve schema information.
-    Args:
-        cursor: A pymysql cursor object connected to the database.
-    Returns:
-        A formatted string representing the database schema.
-    """
-    schema = ""
-
-    # Fetch all tables in the current database
-    cursor.execute("SHOW TABLES")
-    
-    # Handle both DictCursor and regular cursor cases for tables
-    tables = []
-    fetched_tables = cursor.fetchall()
-    if fetched_tables:
-        if isinstance(fetched_tables[0], dict):
-            # For DictCursor (keys are column names)
-            db_name = os.getenv('MYSQL_DATABASE', 'SchoolDb')
-            tables = [row["Tables_in_" + db_name] for row in fetched_tables]
-        else:
-            # For regular cursor (numeric indices)
-            tables = [row[0] for row in fetched_tables]
-
-    # For each table, fetch its columns and their data types
-    for table in tables:
-        # Use backticks for table names to handle special characters or reserved words
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        
-        # Handle both DictCursor and regular cursor for columns
-        for column in columns:
-            if isinstance(column, dict):  # DictCursor case
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:  # Regular cursor case
-                column_name = column[0]
-                data_type = column[1]
-                
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
+# Prompt dumps and similar diagnostics go to this logger; set LOG_LEVEL=DEBUG to see them
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format="%(message)s")
+logger = logging.getLogger(__name__)
 
 # ------------------------
 # 🧠 Build LLM prompt (now returns a list of contents for Gemini API)
 # ------------------------
+# Fixed rules that open every SQL prompt; Gemini has no separate system role here,
+# so they are prepended to the user message (separator included)
+SQL_PROMPT_PREFIX = """
+You are a SQL expert. You will receive a database schema and a user question.
+Your task is to generate a valid MySQL SELECT query that answers the user's question.
+
+You MUST adhere to these rules:
+- Use ONLY table and column names exactly as provided in the schema.
+- NEVER invent or singularize table names (e.g., use 'Students' if that's in the schema, not 'Student').
+- Reply with a JSON object whose "sql" field holds one valid MySQL SELECT statement, ending with a semicolon.
+- Do NOT include any explanations or comments, inside the "sql" field or outside the JSON object.
+- Use backticks (`) for quoting identifiers if they contain special characters or are reserved words.
+- Use LIMIT instead of TOP for row limiting.
+""" + "\n\n"
+
 def build_prompt(user_question, schema, error_message=None, previous_sql=None):
     """
     Constructs the prompt messages for the LLM, including schema, user question,
@@ -71,23 +43,6 @@ def build_prompt(user_question, schema, error_message=None, previous_sql=None):
     Returns:
         list: A list of message dictionaries in Gemini's API 'contents' format.
     """
-    # The system instructions are now explicitly part of the initial user message,
-    # as Gemini's `generate_content` doesn't have a separate `system` role parameter.
-    # We structure it clearly within the 'user' part.
-    
-    system_instruction = """
-You are a SQL expert. You will receive a database schema and a user question.
-Your task is to generate a valid MySQL SELECT query that answers the user's question.
-
-You MUST adhere to these rules:
-- Use ONLY table and column names exactly as provided in the schema.
-- NEVER invent or singularize table names (e.g., use 'Students' if that's in the schema, not 'Student').
-- Output ONLY a valid MySQL SELECT statement, ending with a semicolon.
-- Do NOT include any explanations, comments, or additional text outside of the SQL query.
-- Use backticks (`) for quoting identifiers if they contain special characters or are reserved words.
-- Use LIMIT instead of TOP for row limiting.
-"""
-
     user_message_content = f"""
 Schema:
 {schema}
@@ -113,36 +68,20 @@ Try again. ONLY use the tables and columns listed in this schema.
     
     # Gemini's `generate_content` expects a list of parts, typically one text part for a simple prompt
     contents = [
-        {"role": "user", "parts": [{"text": system_instruction + "\n\n" + user_message_content}]}
+        {"role": "user", "parts": [{"text": SQL_PROMPT_PREFIX + user_message_content}]}
     ]
     
     return contents
 
 # ------------------------
-# 🧼 Extract SELECT statement
+# 🧼 Structured SQL reply
 # ------------------------
-def extract_valid_sql(text):
-    """
-    Extracts a valid SQL SELECT statement from the LLM's response.
-    Validates for MySQL compatibility.
-    Args:
-        text (str): The raw text response from the LLM.
-    Returns:
-        str: The extracted and validated SQL query.
-    Raises:
-        ValueError: If no valid SELECT statement is found or if invalid keywords are present.
-    """
-    # Use re.DOTALL to allow '.' to match newlines, important for multi-line SQL
-    match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
-    if not match:
-        raise ValueError("No valid SELECT statement found in LLM response.")
-    sql = match.group(1).strip()
-    
-    # Basic MySQL specific validation
-    if "TOP" in sql.upper():
-        raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
-    
-    return sql
+# Structured output: the reply is {"sql": "..."}, with no fences or commentary to strip
+SQL_GENERATION_CONFIG = {
+    "max_output_tokens": 200,  # Adjust as needed for SQL query length
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "object", "properties": {"sql": {"type": "string"}}, "required": ["sql"]},
+}
 
 # ------------------------
 # 🚀 MAIN SCRIPT
@@ -198,21 +137,24 @@ error_message = None
 sql_query = None
 data = None
 
-while attempt < MAX_RETRIES:
+# A recently answered question skips both the LLM and the database
+cached = get_cached_result(user_question, schema, f"gemini/{GEMINI_MODEL}")
+if cached:
+    sql_query, data = cached
+    print("♻️ Using cached result:\n", sql_query)
+
+while data is None and attempt < MAX_RETRIES:
     print(f"\n--- Attempt {attempt + 1} ---")
     # Build prompt contents for Gemini API
     prompt_contents = build_prompt(user_question, schema, error_message, sql_query)
-    print("\nprompt_contents:\n", prompt_contents, "\n")
+    logger.debug("prompt_contents:\n%s\n", prompt_contents)
     
     try:
-        # Call Gemini API
+        # Call Gemini API; the JSON reply is read whole so it stays parseable
         response = model.generate_content(
             prompt_contents, # Pass the list of contents
-            generation_config={"max_output_tokens": 200} # Adjust max_output_tokens as needed for SQL query length
+            generation_config=SQL_GENERATION_CONFIG
         )
-        
-        # Extract the text content from the Gemini response
-        # Access .text directly for simple text responses
         raw_response = response.text.strip()
             
         print(f"🔍 LLM Raw Response:\n{raw_response}")
@@ -222,16 +164,14 @@ while attempt < MAX_RETRIES:
 
         # Execute the SQL query against the database
         cursor.execute(sql_query)
-        data = cursor.fetchall()  # Using DictCursor so we get dictionaries directly
-
-        if not data:
-            raise ValueError("Query ran successfully but returned no results.")
+        data = cursor.fetchmany(MAX_RESULT_ROWS)  # Using DictCursor so we get dictionaries directly
 
         print("Query executed successfully.")
-        break  # ✅ Success: Exit loop if query runs and returns data
+        cache_result(user_question, schema, f"gemini/{GEMINI_MODEL}", sql_query, data)
+        break  # ✅ Success: Exit loop once the query runs, even with no rows
 
     except ValueError as ve:
-        # Handle errors related to SQL extraction or empty results
+        # Handle errors related to SQL extraction
         error_message = str(ve)
         print("🚨 Validation Error:", error_message)
         attempt += 1
@@ -261,7 +201,7 @@ if data:
     print("\n--- Final Result ---")
     # Build prompt for summarization for Gemini
     summary_prompt_text = f"""
-Here are the results of the query:\n{data}
+Here are the results of the query:\n{digest_rows(data)}
 Summarize this nicely for the user.
 """
     summary_contents = [{"role": "user", "parts": [{"text": summary_prompt_text}]}]
@@ -276,6 +216,10 @@ Summarize this nicely for the user.
     except Exception as e:
         print(f"Failed to generate summary: {e}")
         print("Raw Data:", data) # Fallback to printing raw data if summary fails
+elif data is not None:
+    # An empty result is a valid answer; no summary call is needed to say so
+    print("\n--- Final Result ---")
+    print("📄 Summary:\n", "No records match the question.")
 else:
     print("\n❌ Failed after retries. Please rephrase your question or check the database/schema.")
 
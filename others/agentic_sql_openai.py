@@ -1,64 +1,17 @@
 import pymysql
-import re
 import os
 from dotenv import load_dotenv
 from openai import OpenAI  # Changed from anthropic to openai
+from agentic_sql_common import get_db_schema, get_cached_result, cache_result, sql_is_complete, extract_valid_sql, digest_rows, MAX_RESULT_ROWS
 
 # Load environment variables from .env file
 load_dotenv()
 
-# ------------------------
-# 🔍 Get DB schema (Updated for MySQL)
-# ------------------------
-def get_db_schema(cursor):
-    """
-    Introspects the MySQL database to retrieve schema information.
-    Args:
-        cursor: A pymysql cursor object connected to the database.
-    Returns:
-        A formatted string representing the database schema.
-    """
-    schema = ""
-
-    # Fetch all tables in the current database
-    cursor.execute("SHOW TABLES")
-    
-    # Handle both DictCursor and regular cursor cases
-    try:
-        # For DictCursor (keys are column names)
-        tables = [row["Tables_in_" + os.getenv('MYSQL_DATABASE', 'SchoolDb')] for row in cursor.fetchall()]
-    except KeyError:
-        # For regular cursor (numeric indices)
-        cursor.execute("SHOW TABLES")
-        tables = [row[0] for row in cursor.fetchall()]
-
-    # For each table, fetch its columns and their data types
-    for table in tables:
-        cursor.execute(f"SHOW COLUMNS FROM `{table}`")  # Added backticks for safety
-        columns = cursor.fetchall()
-        schema += f"Table: {table}\n"
-        
-        # Handle both DictCursor and regular cursor for columns
-        for column in columns:
-            if isinstance(column, dict):  # DictCursor case
-                column_name = column["Field"]
-                data_type = column["Type"]
-            else:  # Regular cursor case
-                column_name = column[0]
-                data_type = column[1]
-                
-            schema += f"- {column_name} ({data_type})\n"
-        schema += "\n"
-    return schema.strip()
-
 # ------------------------
 # 🧠 Build LLM prompt (updated for MySQL compatibility)
 # ------------------------
-def build_prompt(user_question, schema, error_message=None, previous_sql=None):
-    """
-    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
-    """
-    system_message = """
+# Built once and reused by reference in every request's message list
+SQL_SYSTEM_MESSAGE = {"role": "system", "content": """
 You are a SQL expert. You will receive a database schema and a user question.
 Your task is to generate a valid MySQL SELECT query that answers the user's question.
 
@@ -69,8 +22,12 @@ You MUST adhere to these rules:
 - Do NOT include any explanations, comments, or additional text outside of the SQL query.
 - Use backticks (`) for quoting identifiers if they contain special characters.
 - Use LIMIT instead of TOP for row limiting.
-"""
+"""}
 
+def build_prompt(user_question, schema, error_message=None, previous_sql=None):
+    """
+    Constructs the prompt messages for the LLM, now with MySQL-specific guidance.
+    """
     user_message = f"""
 Schema:
 {schema}
@@ -95,28 +52,28 @@ Try again. ONLY use the tables and columns listed in this schema.
 """
     
     return [
-        {"role": "system", "content": system_message},
+        SQL_SYSTEM_MESSAGE,
         {"role": "user", "content": user_message}
     ]
 
 # ------------------------
-# 🧼 Extract SELECT statement (updated for MySQL)
+# 🧼 Stream the SQL reply
 # ------------------------
-def extract_valid_sql(text):
+def stream_sql_response(client, **kwargs):
     """
-    Extracts a valid SQL SELECT statement from the LLM's response.
-    Now validates for MySQL compatibility.
+    Streams the model's reply and stops reading as soon as it holds a complete
+    SELECT statement; whatever would follow is explanation we don't use.
     """
-    match = re.search(r"(SELECT\s.+?;)", text, re.IGNORECASE | re.DOTALL)
-    if not match:
-        raise ValueError("No valid SELECT statement found in LLM response.")
-    sql = match.group(1).strip()
-    
-    # Basic MySQL validation
-    if "TOP" in sql.upper():
-        raise ValueError("Invalid keyword 'TOP' for MySQL. Use LIMIT instead.")
-    
-    return sql
+    chunks = []
+    with client.chat.completions.create(stream=True, **kwargs) as stream:
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            chunks.append(text)
+            if ";" in text and sql_is_complete("".join(chunks)):
+                break
+    return "".join(chunks).strip()
 
 # ------------------------
 # 🚀 MAIN SCRIPT
@@ -165,18 +122,24 @@ error_message = None
 sql_query = None
 data = None
 
-while attempt < MAX_RETRIES:
+# A recently answered question skips both the LLM and the database
+cached = get_cached_result(user_question, schema, f"openai/{OPENAI_MODEL}")
+if cached:
+    sql_query, data = cached
+    print("♻️ Using cached result:\n", sql_query)
+
+while data is None and attempt < MAX_RETRIES:
     print(f"\n--- Attempt {attempt + 1} ---")
     messages = build_prompt(user_question, schema, error_message, sql_query)
     
     try:
-        response = client.chat.completions.create(
+        raw_response = stream_sql_response(
+            client,
             model=OPENAI_MODEL,
             messages=messages,
             max_tokens=200,
             temperature=0.3  # Lower temperature for more deterministic SQL generation
         )
-        raw_response = response.choices[0].message.content.strip()
         print(f"🔍 LLM Raw Response:\n{raw_response}")
 
         sql_query = extract_valid_sql(raw_response)
@@ -184,12 +147,10 @@ while attempt < MAX_RETRIES:
 
         # Execute the SQL query
         cursor.execute(sql_query)
-        data = cursor.fetchall()
-
-        if not data:
-            raise ValueError("Query ran successfully but returned no results.")
+        data = cursor.fetchmany(MAX_RESULT_ROWS)
 
         print("Query executed successfully.")
+        cache_result(user_question, schema, f"openai/{OPENAI_MODEL}", sql_query, data)
         break
 
     except ValueError as ve:
@@ -210,7 +171,7 @@ if data:
     print("\n--- Final Result ---")
     summary_messages = [
         {"role": "system", "content": "You are a helpful assistant that summarizes database query results."},
-        {"role": "user", "content": f"Here are the results of the query:\n{data}\nSummarize this nicely for the user."}
+        {"role": "user", "content": f"Here are the results of the query:\n{digest_rows(data)}\nSummarize this nicely for the user."}
     ]
 
     try:
@@ -224,6 +185,10 @@ if data:
     except Exception as e:
         print(f"Failed to generate summary: {e}")
         print("Raw Data:", data)
+elif data is not None:
+    # An empty result is a valid answer; no summary call is needed to say so
+    print("\n--- Final Result ---")
+    print("📄 Summary:\n", "No records match the question.")
 else:
     print("\n❌ Failed after retries. Please rephrase your question or check the database/schema.")
 
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "others"))
+
+try:
+    import agentic_ai_gdrive_api_gemini_v1 as drive_script  # noqa: E402
+except ImportError:  # The script needs the Google, MySQL and PDF client libraries.
+    drive_script = None
+
+
+@unittest.skipIf(drive_script is None, "agentic_ai_gdrive_api_gemini_v1 dependencies are not installed")
+class BatchDocumentsTest(unittest.TestCase):
+    def test_documents_are_split_at_the_budget(self):
+        docs = [("a", "A", 40), ("b", "B", 50), ("c", "C", 20), ("d", "D", 90)]
+        self.assertEqual(
+            list(drive_script.batch_documents(docs, budget=100)),
+            [[("a", "A"), ("b", "B")], [("c", "C")], [("d", "D")]],
+        )
+
+    def test_oversized_document_gets_its_own_batch(self):
+        docs = [("a", "A", 10), ("big", "BIG", 500), ("b", "B", 10)]
+        self.assertEqual(
+            list(drive_script.batch_documents(docs, budget=100)),
+            [[("a", "A")], [("big", "BIG")], [("b", "B")]],
+        )
+
+    def test_no_documents(self):
+        self.assertEqual(list(drive_script.batch_documents([], budget=100)), [])
+
+
+@unittest.skipIf(drive_script is None, "agentic_ai_gdrive_api_gemini_v1 dependencies are not installed")
+class FitToTokenBudgetTest(unittest.TestCase):
+    def test_text_within_the_byte_budget_is_not_counted(self):
+        with mock.patch.object(drive_script, "count_tokens") as count_tokens:
+            self.assertEqual(drive_script.fit_to_token_budget("héllo", budget=6), ("héllo", 6))
+        count_tokens.assert_not_called()
+
+    def test_counted_text_within_budget_is_kept(self):
+        text = "x" * 30
+        with mock.patch.object(drive_script, "count_tokens", side_effect=lambda t: len(t) // 2):
+            self.assertEqual(drive_script.fit_to_token_budget(text, budget=20), (text, 15))
+
+    def test_text_is_cut_and_recounted_until_it_fits(self):
+        text = "x" * 100
+        # A fixed overhead per count makes each proportional cut fall short, forcing several rounds
+        with mock.patch.object(drive_script, "count_tokens", side_effect=lambda t: len(t) * 2 + 30) as count_tokens:
+            fitted, tokens = drive_script.fit_to_token_budget(text, budget=40)
+        self.assertLessEqual(tokens, 40)
+        self.assertEqual(tokens, len(fitted) * 2 + 30)
+        self.assertTrue(text.startswith(fitted))
+        self.assertGreater(count_tokens.call_count, 2)
+
+    def test_count_failure_falls_back_to_a_character_cut(self):
+        text = "x" * (drive_script.MAX_DOC_CHARS + 100)
+        with mock.patch.object(drive_script, "count_tokens", side_effect=RuntimeError("quota")):
+            fitted, tokens = drive_script.fit_to_token_budget(text, budget=10)
+        self.assertEqual(fitted, text[:drive_script.MAX_DOC_CHARS])
+        self.assertEqual(tokens, drive_script.MAX_DOC_CHARS)
+
+
+if __name__ == "__main__":
+    unittest.main()
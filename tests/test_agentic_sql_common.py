@@ -0,0 +1,134 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "others"))
+
+from agentic_sql_common import digest_rows, extract_valid_sql, sql_is_complete, MAX_RESULT_ROWS  # noqa: E402
+
+LIMIT_CLAUSE = f"LIMIT {MAX_RESULT_ROWS};"
+
+
+class LimitInjectionTest(unittest.TestCase):
+    def test_bare_select_gets_limit(self):
+        self.assertEqual(extract_valid_sql("SELECT * FROM Students;"), f"SELECT * FROM Students {LIMIT_CLAUSE}")
+
+    def test_existing_limit_is_kept(self):
+        self.assertEqual(extract_valid_sql("SELECT * FROM Students LIMIT 5;"), "SELECT * FROM Students LIMIT 5;")
+
+    def test_trailing_comments_are_stripped_before_limit(self):
+        for sql in (
+            "SELECT * FROM Students -- every student;",
+            "SELECT * FROM Students # every student\n;",
+            "SELECT * FROM Students /* every student */;",
+            "SELECT * FROM Students /* unterminated",
+        ):
+            with self.subTest(sql=sql):
+                self.assertEqual(extract_valid_sql(sql), f"SELECT * FROM Students {LIMIT_CLAUSE}")
+
+    def test_limit_in_comment_does_not_count(self):
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM Students /* LIMIT 5 */;"), f"SELECT * FROM Students {LIMIT_CLAUSE}"
+        )
+
+    def test_limit_in_string_or_identifier_does_not_count(self):
+        self.assertTrue(extract_valid_sql("SELECT * FROM Notes WHERE body = 'LIMIT 5';").endswith(LIMIT_CLAUSE))
+        self.assertTrue(extract_valid_sql('SELECT * FROM Notes WHERE body = "limit";').endswith(LIMIT_CLAUSE))
+        self.assertTrue(extract_valid_sql("SELECT `limit` FROM Quotas;").endswith(LIMIT_CLAUSE))
+
+    def test_comment_markers_inside_strings_are_kept(self):
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM Notes WHERE body = 'it''s -- # /* fine';"),
+            f"SELECT * FROM Notes WHERE body = 'it''s -- # /* fine' {LIMIT_CLAUSE}",
+        )
+
+    def test_limit_in_subquery_does_not_count(self):
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM (SELECT * FROM Scores LIMIT 5) AS s;"),
+            f"SELECT * FROM (SELECT * FROM Scores LIMIT 5) AS s {LIMIT_CLAUSE}",
+        )
+
+    def test_top_level_limit_after_subquery_is_kept(self):
+        sql = "SELECT * FROM Students WHERE student_id IN (SELECT student_id FROM Scores) LIMIT 3;"
+        self.assertEqual(extract_valid_sql(sql), sql)
+
+    def test_larger_limit_is_capped(self):
+        self.assertEqual(extract_valid_sql("SELECT * FROM Students LIMIT 100000;"), f"SELECT * FROM Students {LIMIT_CLAUSE}")
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM Students LIMIT 10, 100000;"),
+            f"SELECT * FROM Students LIMIT 10, {MAX_RESULT_ROWS};",
+        )
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM Students LIMIT 100000 OFFSET 5000;"),
+            f"SELECT * FROM Students LIMIT {MAX_RESULT_ROWS} OFFSET 5000;",
+        )
+
+    def test_capping_leaves_subquery_limit_alone(self):
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM (SELECT * FROM Scores LIMIT 5000) AS s LIMIT 300;"),
+            f"SELECT * FROM (SELECT * FROM Scores LIMIT 5000) AS s {LIMIT_CLAUSE}",
+        )
+
+
+class FenceTest(unittest.TestCase):
+    def test_matched_fence(self):
+        self.assertEqual(extract_valid_sql("```sql\nSELECT * FROM Students LIMIT 5;\n```"), "SELECT * FROM Students LIMIT 5;")
+
+    def test_unclosed_opening_fence(self):
+        self.assertEqual(
+            extract_valid_sql("Here you go:\n```sql\nSELECT * FROM Students LIMIT 5"), "SELECT * FROM Students LIMIT 5;"
+        )
+
+    def test_stray_closing_fence(self):
+        self.assertEqual(extract_valid_sql("SELECT * FROM Students LIMIT 5\n```"), "SELECT * FROM Students LIMIT 5;")
+        self.assertEqual(
+            extract_valid_sql("SELECT * FROM Students LIMIT 5\n```\nThis lists every student."),
+            "SELECT * FROM Students LIMIT 5;",
+        )
+
+
+class SqlCompleteTest(unittest.TestCase):
+    def test_terminated_select_is_complete(self):
+        self.assertTrue(sql_is_complete("SELECT first_name FROM Students;"))
+        self.assertTrue(sql_is_complete("Here you go:\n```sql\nSELECT first_name FROM Students;"))
+
+    def test_semicolon_in_literal_or_comment_is_not_the_end(self):
+        self.assertFalse(sql_is_complete("SELECT first_name FROM Students WHERE notes = 'a;"))
+        self.assertFalse(sql_is_complete("SELECT first_name FROM Students -- all of them;"))
+        self.assertTrue(sql_is_complete("SELECT first_name FROM Students WHERE notes = 'a;b';"))
+
+    def test_select_in_prose_is_not_a_statement(self):
+        self.assertFalse(sql_is_complete("To select students; use this query:"))
+
+    def test_unfinished_think_block(self):
+        self.assertFalse(sql_is_complete("<think>SELECT 1;"))
+
+    def test_extraction_keeps_semicolon_inside_literal(self):
+        self.assertEqual(
+            extract_valid_sql("To select students; use this query:\nSELECT * FROM Notes WHERE body = 'a;b' LIMIT 5;"),
+            "SELECT * FROM Notes WHERE body = 'a;b' LIMIT 5;",
+        )
+
+
+class DigestRowsTest(unittest.TestCase):
+    def test_empty_result(self):
+        self.assertEqual(digest_rows([]), "rows=0")
+
+    def test_short_result_is_shown_whole_without_stats(self):
+        rows = [{"name": "Ann", "score": 90}, {"name": "Bo", "score": 80}]
+        self.assertEqual(digest_rows(rows), "rows=2\nname,score\nAnn,90\nBo,80")
+
+    def test_long_result_gets_preview_and_numeric_stats(self):
+        rows = [
+            {"name": "Ann", "score": 90, "passed": True},
+            {"name": "Bo", "score": None, "passed": True},
+            {"name": "Cy", "score": 60, "passed": False},
+        ]
+        self.assertEqual(
+            digest_rows(rows, preview_rows=2),
+            "rows=3 (first 2 shown)\nname,score,passed\nAnn,90,True\nBo,,True\nscore: min=60, max=90, mean=75.00",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()